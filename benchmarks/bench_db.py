@@ -0,0 +1,83 @@
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db import Database
+
+class ConnectPerCallDatabase:
+    # 変更前のDatabaseと同じく、呼び出しごとに接続を開き直す
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS notification_channels (
+                    server_id INTEGER PRIMARY KEY,
+                    channel_id INTEGER NOT NULL
+                )
+            ''')
+            conn.commit()
+
+    def add_notification_channel(self, server_id: int, channel_id: int):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO notification_channels (server_id, channel_id)
+                VALUES (?, ?)
+            ''', (server_id, channel_id))
+            conn.commit()
+
+    def get_notification_channels(self):
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute('SELECT server_id, channel_id FROM notification_channels')
+            return {row[0]: row[1] for row in cursor.fetchall()}
+
+    def get_channel_id(self, server_id: int):
+        with sqlite3.connect(self.db_path) as conn:
+            cursor = conn.execute('''
+                SELECT channel_id FROM notification_channels
+                WHERE server_id = ?
+            ''', (server_id,))
+            result = cursor.fetchone()
+            return result[0] if result else None
+
+def measure(database, operations: int, guilds: int):
+    results = {}
+
+    started = time.perf_counter()
+    for i in range(operations):
+        database.add_notification_channel(i % guilds, i)
+    results["add_notification_channel"] = operations / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    for i in range(operations):
+        database.get_channel_id(i % guilds)
+    results["get_channel_id"] = operations / (time.perf_counter() - started)
+
+    reloads = max(1, operations // 100)
+    started = time.perf_counter()
+    for _ in range(reloads):
+        database.get_notification_channels()
+    results["get_notification_channels"] = reloads / (time.perf_counter() - started)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare db.Database against a connect-per-call baseline")
+    parser.add_argument("--operations", type=int, default=2000)
+    parser.add_argument("--guilds", type=int, default=500)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        before = measure(ConnectPerCallDatabase(os.path.join(tmp, "before.db")), args.operations, args.guilds)
+        database = Database(os.path.join(tmp, "after.db"))
+        after = measure(database, args.operations, args.guilds)
+        database.close()
+
+    print(f"{'operation':<28}{'before ops/s':>14}{'after ops/s':>14}{'speedup':>10}")
+    for name in before:
+        print(f"{name:<28}{before[name]:>14.0f}{after[name]:>14.0f}{after[name] / before[name]:>9.1f}x")
+
+if __name__ == "__main__":
+    main()
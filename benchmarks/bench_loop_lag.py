@@ -0,0 +1,67 @@
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db import AsyncDatabase, Database
+
+class SlowDiskDatabase(Database):
+    # 書き込みのたびにfsyncが詰まったディスクを再現する
+    def __init__(self, db_path: str, stall: float):
+        self.stall = stall
+        super().__init__(db_path)
+
+    def add_notification_channel(self, server_id: int, channel_id: int):
+        time.sleep(self.stall)
+        super().add_notification_channel(server_id, channel_id)
+
+async def probe_lag(stop: asyncio.Event, tick: float, samples: list):
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(tick)
+        samples.append(time.perf_counter() - started - tick)
+
+async def run(mode: str, database: Database, writes: int, tick: float):
+    stop = asyncio.Event()
+    samples = []
+    probe = asyncio.create_task(probe_lag(stop, tick, samples))
+    await asyncio.sleep(tick)
+
+    if mode == "sync":
+        for i in range(writes):
+            database.add_notification_channel(i, i)
+            await asyncio.sleep(0)
+    else:
+        async_database = AsyncDatabase(database)
+        for i in range(writes):
+            await async_database.add_notification_channel(i, i)
+
+    stop.set()
+    await probe
+    samples.sort()
+    return {
+        "max": samples[-1] * 1000,
+        "p95": samples[int(len(samples) * 0.95) - 1] * 1000,
+        "mean": sum(samples) / len(samples) * 1000
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Event loop lag with synchronous vs executor-backed database writes")
+    parser.add_argument("--writes", type=int, default=20)
+    parser.add_argument("--stall", type=float, default=0.1, help="simulated fsync stall per write in seconds")
+    parser.add_argument("--tick", type=float, default=0.005, help="lag probe interval in seconds")
+    args = parser.parse_args()
+
+    print(f"{'mode':<8}{'max lag ms':>12}{'p95 lag ms':>12}{'mean lag ms':>13}")
+    for mode in ("sync", "async"):
+        with tempfile.TemporaryDirectory() as tmp:
+            database = SlowDiskDatabase(os.path.join(tmp, f"{mode}.db"), args.stall)
+            result = asyncio.run(run(mode, database, args.writes, args.tick))
+            database.close()
+        print(f"{mode:<8}{result['max']:>12.1f}{result['p95']:>12.1f}{result['mean']:>13.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import aiohttp
+import discord
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from e2e import HarnessBot, StatusServer, summarize
+from fanout import Fanout
+
+async def run(args, shards, base_url, session, server):
+    bot = HarnessBot(argparse.Namespace(**{**vars(args), "shards": shards}), base_url, None, session)
+    bot.fanout = Fanout(bot, max_concurrency=args.fanout_concurrency, rate=args.fanout_rate)
+    embed = discord.Embed(title="Benchmark Status Alert", description="Partial System Outage", color=discord.Color.red())
+
+    server.deliveries.clear()
+    started = time.perf_counter()
+    await bot.fanout.broadcast(f"{shards} shards", embed=embed)
+    elapsed = time.perf_counter() - started
+    await bot.fanout.close()
+    latencies = [delivered_at - started for delivered_at, _, _ in server.deliveries]
+    return {
+        "shards": shards,
+        "delivered": len(latencies),
+        "elapsed_ms": elapsed * 1000,
+        "per_guild": summarize(latencies),
+        "requests_per_second": len(latencies) / elapsed if elapsed else None
+    }
+
+async def main_async(args):
+    server = StatusServer(args.discord_latency / 1000)
+    runner = web.AppRunner(server.app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", 0).start()
+    base_url = f"http://127.0.0.1:{runner.addresses[0][1]}"
+    session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=0))
+
+    results = [await run(args, shards, base_url, session, server) for shards in args.shards]
+    print(f"{args.guilds} guilds, {args.discord_latency:.0f}ms Discord latency, "
+          f"{args.fanout_concurrency} per shard, {args.fanout_rate:.0f} req/s global limit")
+    for result in results:
+        print(
+            f"{result['shards']:>3} shards: {result['delivered']} delivered in {result['elapsed_ms']:.0f}ms, "
+            f"p50 {result['per_guild']['p50_ms']:.0f}ms, p95 {result['per_guild']['p95_ms']:.0f}ms, "
+            f"{result['requests_per_second']:.1f} req/s"
+        )
+
+    await session.close()
+    await runner.cleanup()
+
+def main():
+    parser = argparse.ArgumentParser(description="Notification delivery time versus shard count against a fake Discord sink")
+    parser.add_argument("--guilds", type=int, default=1000)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--fanout-concurrency", type=int, default=10)
+    parser.add_argument("--fanout-rate", type=float, default=45.0, help="global Discord request limit shared by every shard")
+    parser.add_argument("--poll-concurrency", type=int, default=4)
+    parser.add_argument("--discord-latency", type=float, default=100.0, help="simulated Discord REST latency in ms")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,334 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from db import AsyncDatabase, Database
+from digest import NotificationDigest
+from fanout import Fanout
+from http_client import StatusClient
+from microsoftCog import Microsoft
+from providers import STATUSPAGE_PROVIDERS
+from routing import RoutingTable
+from scheduler import PollScheduler
+from slackCog import Slack
+from statuspageCog import StatusPage
+from vrchatCog import VRchat
+
+STATUSPAGE_BODIES = {
+    False: {"status": {"indicator": "none", "description": "All Systems Operational"}},
+    True: {"status": {"indicator": "major", "description": "Partial System Outage"}}
+}
+
+SLACK_BODIES = {
+    False: {"status": "ok", "active_incidents": []},
+    True: {
+        "status": "active",
+        "active_incidents": [{
+            "title": "Messages are delayed",
+            "type": "outage",
+            "services": ["Messaging"],
+            "notes": [{"body": "We are investigating."}]
+        }]
+    }
+}
+
+MICROSOFT_BODIES = {
+    False: {"IsAllUp": True, "Services": []},
+    True: {
+        "IsAllUp": False,
+        "Services": [{"Name": "Exchange Online", "IsUp": False, "Messages": [{"Lines": ["Users can't send mail."]}]}]
+    }
+}
+
+def guild_id(index):
+    # 実際のsnowflakeと同じく (id >> 22) がシャードの振り分けに使われるようにする
+    return (1 << 40) + (index << 22)
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+def summarize(values):
+    if not values:
+        return None
+    return {
+        "p50_ms": percentile(values, 0.5) * 1000,
+        "p95_ms": percentile(values, 0.95) * 1000,
+        "max_ms": max(values) * 1000
+    }
+
+class StatusServer:
+    # 全プロバイダーの形式のstatus.jsonと、Discord REST APIの代わりの受信口を1つのaiohttpサーバーで提供する
+    def __init__(self, discord_latency: float):
+        self.discord_latency = discord_latency
+        self.degraded = False
+        self.served_at = {}
+        self.deliveries = []
+        self.next_message_id = 1
+        self.app = web.Application()
+        self.app.router.add_get("/statuspage/{key}/api/v2/status.json", self.statuspage)
+        self.app.router.add_get("/slack/api/v2.0.0/current", self.slack)
+        self.app.router.add_get("/microsoft/api/servicestatus/index", self.microsoft)
+        self.app.router.add_get("/vrchat/metrics/{series}.json", self.vrchat_metric)
+        self.app.router.add_post("/discord/channels/{channel_id}/messages", self.discord_send)
+        self.app.router.add_patch("/discord/channels/{channel_id}/messages/{message_id}", self.discord_edit)
+        self.app.router.add_post("/discord/webhooks/{webhook_id}/{token}", self.discord_send)
+
+    def respond(self, request, key, body):
+        payload = json.dumps(body).encode()
+        etag = '"' + hashlib.sha1(payload).hexdigest() + '"'
+        self.served_at[key] = time.perf_counter()
+        if request.headers.get("If-None-Match") == etag:
+            return web.Response(status=304, headers={"ETag": etag})
+        return web.Response(body=payload, content_type="application/json", headers={"ETag": etag})
+
+    async def statuspage(self, request):
+        key = request.match_info["key"]
+        return self.respond(request, key, STATUSPAGE_BODIES[self.degraded])
+
+    async def slack(self, request):
+        return self.respond(request, "Slack", SLACK_BODIES[self.degraded])
+
+    async def microsoft(self, request):
+        return self.respond(request, "Microsoft", MICROSOFT_BODIES[self.degraded])
+
+    async def vrchat_metric(self, request):
+        return web.json_response([{"timestamp": int(time.time()), "value": 12345.678}])
+
+    async def discord_send(self, request):
+        body = await request.json()
+        if self.discord_latency:
+            await asyncio.sleep(self.discord_latency)
+        self.deliveries.append((time.perf_counter(), "send", body))
+        self.next_message_id += 1
+        return web.json_response({"id": self.next_message_id, "channel_id": request.match_info.get("channel_id")})
+
+    async def discord_edit(self, request):
+        body = await request.json()
+        if self.discord_latency:
+            await asyncio.sleep(self.discord_latency)
+        self.deliveries.append((time.perf_counter(), "edit", body))
+        return web.json_response({"id": int(request.match_info["message_id"])})
+
+class FakeMessage:
+    def __init__(self, channel, message_id):
+        self.channel = channel
+        self.id = message_id
+
+    async def edit(self, content=None, embed=None):
+        body = {"content": content, "embed": embed.to_dict() if embed else None}
+        url = f"{self.channel.base_url}/discord/channels/{self.channel.id}/messages/{self.id}"
+        async with self.channel.session.patch(url, json=body) as response:
+            await response.read()
+        return self
+
+class FakeChannel:
+    def __init__(self, session, base_url, channel_id):
+        self.session = session
+        self.base_url = base_url
+        self.id = channel_id
+
+    async def send(self, content=None, embed=None):
+        body = {"content": content, "embed": embed.to_dict() if embed else None}
+        async with self.session.post(f"{self.base_url}/discord/channels/{self.id}/messages", json=body) as response:
+            data = await response.json()
+        return FakeMessage(self, data["id"])
+
+    def get_partial_message(self, message_id):
+        return FakeMessage(self, message_id)
+
+class FakeWebhook:
+    def __init__(self, session, base_url, webhook_id, token):
+        self.session = session
+        self.url = f"{base_url}/discord/webhooks/{webhook_id}/{token}"
+
+    async def send(self, content=None, embed=None):
+        body = {"content": content, "embed": embed.to_dict() if embed else None}
+        async with self.session.post(self.url, json=body) as response:
+            await response.read()
+
+class HarnessBot:
+    def __init__(self, args, base_url, database, session):
+        self.base_url = base_url
+        self.session = session
+        self.scheduler = PollScheduler(interval=60.0, max_concurrency=args.poll_concurrency)
+        self.fanout = Fanout(self, max_concurrency=args.fanout_concurrency, rate=args.fanout_rate)
+        self.notifications = NotificationDigest(self.fanout, window=getattr(args, "coalesce_window", 0.0))
+        self.shard_count = args.shards
+        self.config = RoutingTable()
+        channels = {guild_id(index): 10_000 + index for index in range(args.guilds)}
+        webhooks = {server_id: (channel_id, "token") for server_id, channel_id in channels.items()} if getattr(args, "webhooks", False) else None
+        self.config.load(channels, None, webhooks)
+        self.fanout.webhook_factory = lambda webhook_id, token: FakeWebhook(session, base_url, webhook_id, token)
+        self.database = database
+
+    def get_channel(self, channel_id):
+        return FakeChannel(self.session, self.base_url, channel_id)
+
+    def get_partial_messageable(self, channel_id):
+        return FakeChannel(self.session, self.base_url, channel_id)
+
+def statuspage_rows(base_url, count):
+    rows = []
+    for index in range(count):
+        template = STATUSPAGE_PROVIDERS[index % len(STATUSPAGE_PROVIDERS)]
+        name = template.name if index < len(STATUSPAGE_PROVIDERS) else f"{template.name}{index}"
+        rows.append(template._replace(
+            name=name,
+            label=name,
+            page_url=f"{base_url}/statuspage/{name}",
+            show_updated_at=False
+        ))
+    return rows
+
+async def run_cycle(bot):
+    # スケジューラーと同じ同時実行数で全ジョブを1周だけ実行する
+    semaphore = asyncio.Semaphore(bot.scheduler.max_concurrency)
+
+    async def run(job):
+        async with semaphore:
+            await job.callback()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run(job) for job in bot.scheduler.jobs.values()))
+    return time.perf_counter() - started
+
+def delivery_stats(server, since, names):
+    # 通知Embedのフッター(「<表示名> Status Monitor」)からどのプロバイダーの配信かを判定する
+    per_provider = {}
+    for delivered_at, kind, body in server.deliveries:
+        if delivered_at < since or kind != "send" or not body.get("embed"):
+            continue
+        footer = body["embed"].get("footer", {}).get("text", "")
+        # まとめて送られた通知はフッターに複数の表示名が並ぶ
+        for display_name in footer.replace(" Status Monitor", "").split(", "):
+            if display_name in names:
+                per_provider.setdefault(names[display_name], []).append(delivered_at)
+
+    first_latencies, last_latencies = [], []
+    for key, times in per_provider.items():
+        detected_at = server.served_at.get(key, since)
+        first_latencies.append(min(times) - detected_at)
+        last_latencies.append(max(times) - detected_at)
+
+    requests = [delivered_at for delivered_at, _, _ in server.deliveries if delivered_at >= since]
+    duration = max(requests) - min(requests) if len(requests) > 1 else 0.0
+    return {
+        "providers_notified": len(per_provider),
+        "detection_to_first_guild": summarize(first_latencies),
+        "detection_to_last_guild": summarize(last_latencies),
+        "discord_requests": len(requests),
+        "notifications_sent": sum(1 for delivered_at, kind, body in server.deliveries if delivered_at >= since and kind == "send" and body.get("embed")),
+        "fanout_requests_per_second": len(requests) / duration if duration else None
+    }
+
+async def main_async(args):
+    server = StatusServer(args.discord_latency / 1000)
+    runner = web.AppRunner(server.app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", args.port)
+    await site.start()
+    port = runner.addresses[0][1]
+    base_url = f"http://127.0.0.1:{port}"
+
+    tmp = tempfile.TemporaryDirectory()
+    database = AsyncDatabase(Database(os.path.join(tmp.name, "bench.db")))
+    status_client = StatusClient(limit_per_host=args.limit_per_host)
+    discord_session = aiohttp.ClientSession()
+    bot = HarnessBot(args, base_url, database, discord_session)
+
+    statuspage_count = max(0, args.providers - 3)
+    rows = statuspage_rows(base_url, statuspage_count)
+    cogs = [StatusPage(bot, status_client, providers=rows)]
+    names = {row.display_name: row.name for row in rows}
+    if args.providers >= 1:
+        slack = Slack(bot, status_client)
+        slack.status_url = f"{base_url}/slack/api/v2.0.0/current"
+        cogs.append(slack)
+        names["Slack"] = "Slack"
+    if args.providers >= 2:
+        microsoft = Microsoft(bot, status_client)
+        microsoft.status_url = f"{base_url}/microsoft/api/servicestatus/index"
+        cogs.append(microsoft)
+        names["Microsoft"] = "Microsoft"
+    if args.providers >= 3:
+        vrchat = VRchat(bot, status_client)
+        vrchat.status_url = f"{base_url}/statuspage/VRchat/api/v2/status.json"
+        vrchat.metrics_urls = {name: f"{base_url}/vrchat/metrics/{name}.json" for name in vrchat.metrics_urls}
+        cogs.append(vrchat)
+        names["VRchat"] = "VRchat"
+    for cog in cogs:
+        await cog.cog_load()
+
+    report = {
+        "providers": len(bot.scheduler.jobs),
+        "guilds": args.guilds,
+        "settings": {
+            "poll_concurrency": args.poll_concurrency,
+            "fanout_concurrency": args.fanout_concurrency,
+            "fanout_rate": args.fanout_rate,
+            "shards": args.shards,
+            "coalesce_window": args.coalesce_window,
+            "webhooks": args.webhooks,
+            "discord_latency_ms": args.discord_latency
+        },
+        "phases": {}
+    }
+
+    await run_cycle(bot)
+    report["phases"]["steady"] = {
+        "poll_cycle_ms": [await run_cycle(bot) * 1000 for _ in range(args.cycles)],
+        "not_modified": sum(status_client.not_modified.values())
+    }
+
+    for phase, degraded in (("incident", True), ("recovery", False)):
+        server.degraded = degraded
+        since = time.perf_counter()
+        cycle = await run_cycle(bot)
+        # 本番と同じく時間窓の終わりに配信させ、その遅れも検知から配信までの時間に含める
+        await asyncio.sleep(args.coalesce_window)
+        await bot.notifications.close()
+        report["phases"][phase] = {"poll_cycle_ms": [cycle * 1000], **delivery_stats(server, since, names)}
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    await bot.fanout.close()
+    await status_client.close()
+    await discord_session.close()
+    await database.close()
+    tmp.cleanup()
+    await runner.cleanup()
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark against local status pages and a fake Discord sink")
+    parser.add_argument("--providers", type=int, default=27, help="number of providers (Slack, Microsoft and VRChat plus Statuspage rows)")
+    parser.add_argument("--guilds", type=int, default=100)
+    parser.add_argument("--cycles", type=int, default=3, help="steady-state poll cycles to measure")
+    parser.add_argument("--poll-concurrency", type=int, default=4)
+    parser.add_argument("--fanout-concurrency", type=int, default=10)
+    parser.add_argument("--fanout-rate", type=float, default=45.0)
+    parser.add_argument("--shards", type=int, default=1)
+    parser.add_argument("--webhooks", action="store_true", help="deliver notifications through per-guild webhooks")
+    parser.add_argument("--coalesce-window", type=float, default=10.0, help="seconds incident notifications are held to be merged per guild (the bot's NOTIFY_COALESCE_WINDOW default)")
+    parser.add_argument("--limit-per-host", type=int, default=4)
+    parser.add_argument("--discord-latency", type=float, default=20.0, help="simulated Discord REST latency in ms")
+    parser.add_argument("--port", type=int, default=0)
+    parser.add_argument("--output", default="bench_report.json")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+if __name__ == "__main__":
+    main()
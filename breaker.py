@@ -0,0 +1,102 @@
+import random
+import time
+from typing import Optional
+from metrics import BREAKER_OPENS, BREAKER_REJECTED, BREAKER_STATE
+
+CLOSED = "closed"
+HALF_OPEN = "half_open"
+OPEN = "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+class CircuitOpenError(Exception):
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"circuit open, retrying in {max(0.0, retry_in):.0f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+class CircuitBreaker:
+    # 連続で失敗したプロバイダーへの取得を止め、ジッター付きの指数バックオフの後に1件ずつ試す。
+    # 半開状態で probes 回続けて成功したら元に戻す
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        backoff: float = 60.0,
+        max_backoff: float = 1800.0,
+        probes: int = 2
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.probes = probes
+        self.state = CLOSED
+        self.failures = 0
+        self.successes = 0
+        self.opens = 0
+        self.opened_at: Optional[float] = None
+        self.retry_at = 0.0
+        self.probing = False
+        self.unknown_notified = False
+        BREAKER_STATE.set(STATE_VALUES[CLOSED], name)
+
+    def allow(self, now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            if now < self.retry_at:
+                BREAKER_REJECTED.inc(self.name)
+                return False
+            self._set(HALF_OPEN)
+            self.successes = 0
+            print(f"{self.name} circuit half-open, probing")
+        if self.probing:
+            BREAKER_REJECTED.inc(self.name)
+            return False
+        self.probing = True
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.probing = False
+        if self.state != HALF_OPEN:
+            return
+        self.successes += 1
+        if self.successes >= self.probes:
+            self.opens = 0
+            self.opened_at = None
+            self._set(CLOSED)
+            print(f"{self.name} circuit closed")
+
+    def record_failure(self, now: Optional[float] = None):
+        now = time.monotonic() if now is None else now
+        self.probing = False
+        self.failures += 1
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+            self._open(now)
+
+    def release(self):
+        # 結果を数えずに半開の試行枠だけ返す
+        self.probing = False
+
+    def open_for(self, now: Optional[float] = None) -> float:
+        if self.opened_at is None:
+            return 0.0
+        return (time.monotonic() if now is None else now) - self.opened_at
+
+    def _open(self, now: float):
+        # 全プロバイダーが同時に落ちても再試行が揃わないよう、待ち時間の後半をランダムにする
+        delay = min(self.max_backoff, self.backoff * 2 ** self.opens)
+        delay = delay / 2 + random.uniform(0, delay / 2)
+        self.opens += 1
+        self.retry_at = now + delay
+        if self.opened_at is None:
+            self.opened_at = now
+        self._set(OPEN)
+        BREAKER_OPENS.inc(self.name)
+        print(f"{self.name} circuit opened after {self.failures} failures, retrying in {delay:.0f}s")
+
+    def _set(self, state: str):
+        self.state = state
+        BREAKER_STATE.set(STATE_VALUES[state], self.name)
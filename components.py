@@ -0,0 +1,68 @@
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+OPERATIONAL = "operational"
+
+class ComponentChange(NamedTuple):
+    kind: str
+    id: str
+    name: str
+    previous: Optional[str]
+    current: Optional[str]
+
+class PageSnapshot(NamedTuple):
+    updated_at: Optional[str]
+    # (kind, id) -> (updated_at, name, status)
+    items: Dict[Tuple[str, str], Tuple[Optional[str], str, Optional[str]]]
+
+class ComponentTracker:
+    # summary.json の components / incidents を id ごとに覚えておき、前回と比べて変わったものだけを返す。
+    # updated_at が前回と同じ項目は状態を見ずにそのまま引き継ぐので、大きいページでも1周のコストは小さい
+    def __init__(self):
+        self.snapshots: Dict[str, PageSnapshot] = {}
+
+    def affected(self, provider: str) -> List[Tuple[str, str]]:
+        snapshot = self.snapshots.get(provider)
+        if snapshot is None:
+            return []
+        return [
+            (name, status) for (kind, _), (_, name, status) in snapshot.items.items()
+            if kind == "component" and status != OPERATIONAL
+        ]
+
+    def diff(self, provider: str, summary: Dict[str, Any]) -> List[ComponentChange]:
+        previous = self.snapshots.get(provider)
+        updated_at = (summary.get("page") or {}).get("updated_at")
+        if previous is not None and updated_at is not None and previous.updated_at == updated_at:
+            return []
+
+        items = {}
+        changes = []
+        sources = (("component", summary.get("components") or []), ("incident", summary.get("incidents") or []))
+        for kind, entries in sources:
+            for entry in entries:
+                # グループは配下のコンポーネントと同じ変化を二重に出すことになるので比べない
+                if kind == "component" and entry.get("group"):
+                    continue
+                key = (kind, entry["id"])
+                old = previous.items.get(key) if previous is not None else None
+                if old is not None and old[0] == entry.get("updated_at"):
+                    items[key] = old
+                    continue
+
+                items[key] = (entry.get("updated_at"), entry.get("name", ""), entry.get("status"))
+                if previous is None:
+                    continue
+                old_status = old[2] if old is not None else None
+                new_status = items[key][2]
+                if old_status == new_status or (old is None and new_status == OPERATIONAL):
+                    continue
+                changes.append(ComponentChange(kind, entry["id"], items[key][1], old_status, new_status))
+
+        if previous is not None:
+            # 解決したインシデントは summary.json から消えるので、消えたことを resolved として扱う
+            for (kind, item_id), (_, name, status) in previous.items.items():
+                if kind == "incident" and (kind, item_id) not in items and status != "resolved":
+                    changes.append(ComponentChange(kind, item_id, name, status, "resolved"))
+
+        self.snapshots[provider] = PageSnapshot(updated_at, items)
+        return changes
@@ -1,52 +1,196 @@
+import asyncio
 import sqlite3
-from typing import Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Dict, Optional, Set, Tuple
+from history import StatusHistory
 
 class Database:
-    def __init__(self, db_path: str = 'config.db'):
+    def __init__(self, db_path: str = 'config.db', history_max_gap: int = 900):
         self.db_path = db_path
+        # 接続はプロセスの間ずっと使い回す
+        self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
         self._initialize_db()
+        self.history = StatusHistory(self.conn, history_max_gap)
 
     def _initialize_db(self):
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
+        with self.conn:
+            self.conn.execute('''
                 CREATE TABLE IF NOT EXISTS notification_channels (
                     server_id INTEGER PRIMARY KEY,
                     channel_id INTEGER NOT NULL
                 )
             ''')
-            conn.commit()
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS provider_state (
+                    provider TEXT PRIMARY KEY,
+                    is_api_heavy INTEGER NOT NULL,
+                    last_status TEXT
+                )
+            ''')
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS status_messages (
+                    provider TEXT NOT NULL,
+                    server_id INTEGER NOT NULL,
+                    channel_id INTEGER NOT NULL,
+                    message_id INTEGER NOT NULL,
+                    PRIMARY KEY (provider, server_id)
+                )
+            ''')
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS notification_webhooks (
+                    server_id INTEGER PRIMARY KEY,
+                    webhook_id INTEGER NOT NULL,
+                    webhook_token TEXT NOT NULL
+                )
+            ''')
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS subscriptions (
+                    server_id INTEGER NOT NULL,
+                    provider TEXT NOT NULL,
+                    PRIMARY KEY (server_id, provider)
+                ) WITHOUT ROWID
+            ''')
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                )
+            ''')
+
+    def close(self):
+        self.conn.close()
 
     def add_notification_channel(self, server_id: int, channel_id: int):
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
+        with self.conn:
+            self.conn.execute('''
                 INSERT OR REPLACE INTO notification_channels (server_id, channel_id)
                 VALUES (?, ?)
             ''', (server_id, channel_id))
-            conn.commit()
 
     def remove_notification_channel(self, server_id: int):
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
+        with self.conn:
+            self.conn.execute('''
                 DELETE FROM notification_channels
                 WHERE server_id = ?
             ''', (server_id,))
-            conn.commit()
 
     def get_notification_channels(self) -> Dict[int, int]:
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT server_id, channel_id FROM notification_channels')
-            return {row[0]: row[1] for row in cursor.fetchall()}
+        cursor = self.conn.execute('SELECT server_id, channel_id FROM notification_channels')
+        return {row[0]: row[1] for row in cursor.fetchall()}
 
     def get_channel_id(self, server_id: int) -> Optional[int]:
-        with sqlite3.connect(self.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT channel_id FROM notification_channels
+        cursor = self.conn.execute('''
+            SELECT channel_id FROM notification_channels
+            WHERE server_id = ?
+        ''', (server_id,))
+        result = cursor.fetchone()
+        return result[0] if result else None
+
+    def set_webhook(self, server_id: int, webhook_id: int, webhook_token: str):
+        with self.conn:
+            self.conn.execute('''
+                INSERT OR REPLACE INTO notification_webhooks (server_id, webhook_id, webhook_token)
+                VALUES (?, ?, ?)
+            ''', (server_id, webhook_id, webhook_token))
+
+    def remove_webhook(self, server_id: int):
+        with self.conn:
+            self.conn.execute('''
+                DELETE FROM notification_webhooks
                 WHERE server_id = ?
             ''', (server_id,))
-            result = cursor.fetchone()
-            return result[0] if result else None
+
+    def get_webhooks(self) -> Dict[int, Tuple[int, str]]:
+        cursor = self.conn.execute('SELECT server_id, webhook_id, webhook_token FROM notification_webhooks')
+        return {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+
+    def add_subscription(self, server_id: int, provider: str):
+        with self.conn:
+            self.conn.execute('''
+                INSERT OR IGNORE INTO subscriptions (server_id, provider)
+                VALUES (?, ?)
+            ''', (server_id, provider))
+
+    def remove_subscription(self, server_id: int, provider: str):
+        with self.conn:
+            self.conn.execute('''
+                DELETE FROM subscriptions
+                WHERE server_id = ? AND provider = ?
+            ''', (server_id, provider))
+
+    def get_subscriptions(self) -> Dict[int, Set[str]]:
+        subscriptions = {}
+        for server_id, provider in self.conn.execute('SELECT server_id, provider FROM subscriptions'):
+            subscriptions.setdefault(server_id, set()).add(provider)
+        return subscriptions
+
+    def get_provider_states(self) -> Dict[str, Tuple[bool, Optional[str], Dict[int, Tuple[int, int]]]]:
+        cursor = self.conn.execute('SELECT provider, is_api_heavy, last_status FROM provider_state')
+        states = {row[0]: (bool(row[1]), row[2], {}) for row in cursor.fetchall()}
+        cursor = self.conn.execute('SELECT provider, server_id, channel_id, message_id FROM status_messages')
+        for provider, server_id, channel_id, message_id in cursor.fetchall():
+            if provider in states:
+                states[provider][2][server_id] = (channel_id, message_id)
+        return states
+
+    def save_provider_state(
+        self,
+        provider: str,
+        is_api_heavy: bool,
+        last_status: Optional[str],
+        messages: Dict[int, Tuple[int, int]]
+    ):
+        with self.conn:
+            self.conn.execute('''
+                INSERT OR REPLACE INTO provider_state (provider, is_api_heavy, last_status)
+                VALUES (?, ?, ?)
+            ''', (provider, int(is_api_heavy), last_status))
+            self.conn.execute('DELETE FROM status_messages WHERE provider = ?', (provider,))
+            self.conn.executemany('''
+                INSERT INTO status_messages (provider, server_id, channel_id, message_id)
+                VALUES (?, ?, ?, ?)
+            ''', [
+                (provider, server_id, channel_id, message_id)
+                for server_id, (channel_id, message_id) in messages.items()
+            ])
+
+    def record_status(self, provider: str, state: Optional[str]):
+        self.history.record(provider, state)
+
+    def get_uptime(self, provider: str, days: int) -> Tuple[Optional[float], int]:
+        return self.history.uptime(provider, days)
+
+    def get_meta(self, key: str) -> Optional[str]:
+        cursor = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,))
+        result = cursor.fetchone()
+        return result[0] if result else None
+
+    def set_meta(self, key: str, value: str):
+        with self.conn:
+            self.conn.execute('''
+                INSERT OR REPLACE INTO meta (key, value)
+                VALUES (?, ?)
+            ''', (key, value))
+
+class AsyncDatabase:
+    # Databaseの各メソッドを専用スレッドで実行し、ディスクI/Oでイベントループを止めない
+    def __init__(self, database: Database):
+        self.database = database
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="database")
+
+    def __getattr__(self, name):
+        method = getattr(self.database, name)
+
+        async def call(*args, **kwargs):
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, partial(method, *args, **kwargs))
+
+        return call
+
+    async def close(self):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self.database.close)
+        self._executor.shutdown()
@@ -0,0 +1,119 @@
+import asyncio
+import discord
+from datetime import datetime, UTC
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from metrics import NOTIFICATIONS_MERGED
+
+# Embedは全体で6000文字、フィールドは25個まで
+EMBED_BUDGET = 5000
+MAX_FIELDS = 25
+
+def digest_embed(entries: List[Tuple[str, discord.Embed]]) -> discord.Embed:
+    shown = entries if len(entries) <= MAX_FIELDS else entries[:MAX_FIELDS - 1]
+    names = [display_name for display_name, _ in entries]
+    footer = f"{', '.join(names)} Status Monitor"
+    colors = [source.color for _, source in entries if source.color and source.color != discord.Color.green()]
+
+    embed = discord.Embed(
+        title=f"{len(entries)}件のサービスで状態が変化しました",
+        color=colors[0] if colors else discord.Color.green(),
+        timestamp=datetime.now(UTC)
+    )
+    limit = max(100, min(1024, (EMBED_BUDGET - len(footer)) // len(shown)))
+    for _, source in shown:
+        lines = [source.description or ""] + [f"{field.name}: {field.value}" for field in source.fields]
+        embed.add_field(name=(source.title or "")[:256], value="\n".join(lines)[:limit], inline=False)
+    if len(shown) < len(entries):
+        embed.add_field(name="その他", value=f"ほか{len(entries) - len(shown)}件", inline=False)
+    embed.set_footer(text=footer[:2048])
+    return embed
+
+class NotificationDigest:
+    # 上流の障害で複数のサービスが同時に落ちた時、window秒の間に届いた通知をサーバーごとに1つのEmbedにまとめて送る
+    def __init__(self, fanout, window: float = 10.0):
+        self.fanout = fanout
+        self.window = window
+        self.pending: List[Tuple[str, str, discord.Embed, Optional[Callable[[], Awaitable[None]]]]] = []
+        self._timer: Optional[asyncio.Task] = None
+        self._inflight: Set[asyncio.Task] = set()
+        # 時間窓が送信より長くかかっても、同じプロバイダーの通知と後続処理の順番が入れ替わらないようにする
+        self._flushing = asyncio.Lock()
+
+    async def add(
+        self,
+        provider: str,
+        display_name: str,
+        embed: discord.Embed,
+        then: Optional[Callable[[], Awaitable[None]]] = None
+    ):
+        # then は通知が配信された後に呼ばれる(監視メッセージの開始・終了が通知より先に届かないように)
+        if self.window <= 0:
+            await self.fanout.broadcast(f"{provider} notification", provider=provider, via_webhook=True, embed=embed)
+            await self._follow_up(provider, then)
+            return
+        # 検知したcogのポーリングを待たせないよう、送信は時間窓の終わりにまとめて行う
+        self.pending.append((provider, display_name, embed, then))
+        if self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+            self._inflight.add(self._timer)
+            self._timer.add_done_callback(self._inflight.discard)
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.window)
+        # 配信中に届いた通知は次の時間窓に入れる
+        self._timer = None
+        await self.flush()
+
+    async def flush(self):
+        pending, self.pending = self.pending, []
+        if not pending:
+            return
+        async with self._flushing:
+            try:
+                await self._deliver(pending)
+            finally:
+                for provider, _, _, then in pending:
+                    await self._follow_up(provider, then)
+
+    async def _follow_up(self, provider: str, then: Optional[Callable[[], Awaitable[None]]]):
+        if then is None:
+            return
+        try:
+            await then()
+        except Exception as e:
+            print(f"{provider} notification follow-up error: {str(e)}")
+
+    async def _deliver(self, pending: List[Tuple[str, str, discord.Embed, Optional[Callable[[], Awaitable[None]]]]]):
+        if len(pending) == 1:
+            provider, _, embed, _ = pending[0]
+            await self.fanout.broadcast(f"{provider} notification", provider=provider, via_webhook=True, embed=embed)
+            return
+
+        # 購読しているサービスの組み合わせが同じサーバーには同じEmbedを使い回す
+        routes: Dict[int, Tuple[int, List[int]]] = {}
+        for index, (provider, _, _, _) in enumerate(pending):
+            for server_id, channel_id in self.fanout.bot.config.snapshot(provider).items():
+                routes.setdefault(server_id, (channel_id, []))[1].append(index)
+
+        embeds: Dict[Tuple[int, ...], discord.Embed] = {}
+        messages = {}
+        for server_id, (channel_id, indices) in routes.items():
+            key = tuple(indices)
+            if key not in embeds:
+                if len(indices) == 1:
+                    embeds[key] = pending[indices[0]][2]
+                else:
+                    embeds[key] = digest_embed([(pending[index][1], pending[index][2]) for index in indices])
+            messages[server_id] = (channel_id, {"embed": embeds[key]})
+            NOTIFICATIONS_MERGED.inc(amount=len(indices) - 1)
+
+        label = f"digest ({', '.join(provider for provider, _, _, _ in pending)})"
+        await self.fanout.deliver(label, messages, via_webhook=True)
+
+    async def close(self):
+        # 待機中の時間窓は打ち切ってすぐに送り、配信中のものは終わるまで待つ
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        await self.flush()
+        await asyncio.gather(*self._inflight, return_exceptions=True)
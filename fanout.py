@@ -0,0 +1,336 @@
+import asyncio
+import discord
+import hashlib
+import json
+import time
+from functools import partial
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Set, Tuple
+from metrics import DISCORD_ERRORS, DISCORD_LATENCY, OUTBOUND_COLLAPSED, OUTBOUND_QUEUE_DEPTH, OUTBOUND_SKIPPED, OUTBOUND_WAIT
+
+# 値が小さいほど先に送る
+PRIORITY_ALERT = 0
+PRIORITY_EDIT = 1
+PRIORITY_NAMES = {PRIORITY_ALERT: "alert", PRIORITY_EDIT: "edit"}
+
+def embed_fingerprint(embed) -> str:
+    # タイムスタンプは毎回変わるので内容の比較から外す
+    data = embed.to_dict()
+    data.pop("timestamp", None)
+    return hashlib.sha256(json.dumps(data, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+class RateLimiter:
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class OutboundJob:
+    def __init__(
+        self,
+        priority: int,
+        kind: str,
+        key: Optional[Hashable],
+        send: Callable[[], Awaitable[Any]],
+        future: asyncio.Future,
+        queued_at: float,
+        limited: bool = True
+    ):
+        self.priority = priority
+        self.kind = kind
+        self.limited = limited
+        self.key = key
+        self.send = send
+        self.future = future
+        self.queued_at = queued_at
+        self.superseded = False
+
+class OutboundQueue:
+    # Discordへのリクエストを Bot 全体で1つの優先度付きキューに通す。シャードごとに max_concurrency 個の
+    # ワーカーを持ち、レート制限は全シャードで共有する。新しい障害・復旧の通知は定期的な編集より先に送る
+    def __init__(self, limiter: RateLimiter, max_concurrency: int = 10):
+        self.limiter = limiter
+        self.max_concurrency = max_concurrency
+        self.pending: Dict[Hashable, OutboundJob] = {}
+        self._lanes: Dict[int, asyncio.PriorityQueue] = {}
+        self._workers: List[asyncio.Task] = []
+        self._sequence = 0
+
+    def depth(self) -> int:
+        return sum(queue.qsize() for queue in self._lanes.values())
+
+    def submit(
+        self,
+        lane: int,
+        priority: int,
+        kind: str,
+        send: Callable[[], Awaitable[Any]],
+        key: Optional[Hashable] = None,
+        limited: bool = True
+    ) -> asyncio.Future:
+        now = time.monotonic()
+        previous = self.pending.get(key) if key is not None else None
+        if previous is not None:
+            # まだ送っていない同じメッセージへの編集は古い方を捨て、待っている呼び出し元には新しい方の結果を返す
+            previous.superseded = True
+            OUTBOUND_COLLAPSED.inc()
+            job = OutboundJob(min(priority, previous.priority), kind, key, send, previous.future, previous.queued_at, limited)
+        else:
+            job = OutboundJob(priority, kind, key, send, asyncio.get_running_loop().create_future(), now, limited)
+        if key is not None:
+            self.pending[key] = job
+
+        self._sequence += 1
+        self._lane(lane).put_nowait((job.priority, self._sequence, job))
+        OUTBOUND_QUEUE_DEPTH.inc(PRIORITY_NAMES[job.priority])
+        return job.future
+
+    def _lane(self, lane: int) -> asyncio.PriorityQueue:
+        queue = self._lanes.get(lane)
+        if queue is None:
+            queue = self._lanes[lane] = asyncio.PriorityQueue()
+            self._workers.extend(asyncio.create_task(self._work(queue)) for _ in range(self.max_concurrency))
+        return queue
+
+    async def _work(self, queue: asyncio.PriorityQueue):
+        while True:
+            priority, _, job = await queue.get()
+            OUTBOUND_QUEUE_DEPTH.dec(PRIORITY_NAMES[priority])
+            if job.superseded:
+                continue
+            if job.key is not None and self.pending.get(job.key) is job:
+                del self.pending[job.key]
+
+            # ワーカーが止められても、待っている呼び出し元が永遠に待たないよう必ず future を片付ける
+            try:
+                if job.limited:
+                    await self.limiter.acquire()
+                started = time.monotonic()
+                OUTBOUND_WAIT.observe(started - job.queued_at, PRIORITY_NAMES[priority])
+                try:
+                    result = await job.send()
+                except Exception as e:
+                    DISCORD_ERRORS.inc(job.kind)
+                    if not job.future.done():
+                        job.future.set_exception(e)
+                    continue
+                DISCORD_LATENCY.observe(time.monotonic() - started, job.kind)
+                if not job.future.done():
+                    job.future.set_result(result)
+            finally:
+                if not job.future.done():
+                    job.future.cancel()
+
+    async def close(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers.clear()
+        # まだキューに残っているものも取り消す
+        for queue in self._lanes.values():
+            while not queue.empty():
+                priority, _, job = queue.get_nowait()
+                OUTBOUND_QUEUE_DEPTH.dec(PRIORITY_NAMES[priority])
+                job.future.cancel()
+        self._lanes.clear()
+        self.pending.clear()
+
+class WebhookTarget:
+    # Webhookからの送信はBotのグローバルレート制限に数えられず、Webhookごとの制限はdiscord.pyが待ってくれる
+    rate_limited = False
+
+    def __init__(self, fanout, server_id: int, channel, webhook):
+        self.fanout = fanout
+        self.server_id = server_id
+        self.channel = channel
+        self.webhook = webhook
+
+    async def send(self, **kwargs):
+        try:
+            return await self.webhook.send(**kwargs)
+        except discord.NotFound:
+            # Webhookが削除されていたら設定から外し、以後はBotとして送る
+            await self.fanout.forget_webhook(self.server_id)
+            return await self.channel.send(**kwargs)
+
+class FanoutReport:
+    def __init__(self, label: str, targets: int, delivered: int, elapsed: float, spread: float, shards: int = 1):
+        self.label = label
+        self.targets = targets
+        self.delivered = delivered
+        self.elapsed = elapsed
+        self.spread = spread
+        self.shards = shards
+
+class Fanout:
+    # チャンネルごとのバケットはdiscord.pyのHTTPClientが待ってくれるので、
+    # ここではシャードごとの同時実行数とBot全体のグローバルレート制限だけを守る
+    def __init__(self, bot, max_concurrency: int = 10, rate: float = 45.0, refresh_interval: float = 900.0):
+        self.bot = bot
+        self.max_concurrency = max_concurrency
+        self.limiter = RateLimiter(rate)
+        self.queue = OutboundQueue(self.limiter, max_concurrency)
+        self._background: Set[asyncio.Task] = set()
+        self.webhook_factory = lambda webhook_id, token: discord.Webhook.partial(webhook_id, token, client=bot)
+        self.refresh_interval = refresh_interval
+        self.reports: Dict[str, FanoutReport] = {}
+        self.fingerprints: Dict[Hashable, Tuple[str, float]] = {}
+
+    def is_unchanged(self, key: Hashable, embed) -> bool:
+        # 内容が同じ編集はスキップし、タイムスタンプだけは refresh_interval ごとに更新する
+        fingerprint = embed_fingerprint(embed)
+        now = time.monotonic()
+        previous = self.fingerprints.get(key)
+        if previous and previous[0] == fingerprint and now - previous[1] < self.refresh_interval:
+            OUTBOUND_SKIPPED.inc(key)
+            return True
+        self.fingerprints[key] = (fingerprint, now)
+        return False
+
+    def shard_of(self, server_id: int) -> int:
+        # Discordと同じ (guild_id >> 22) % shard_count でサーバーの担当シャードを決める
+        shard_count = getattr(self.bot, "shard_count", None) or 1
+        return (server_id >> 22) % shard_count
+
+    def destination(self, server_id: int, channel_id: int, via_webhook: bool = False):
+        channel = self.bot.get_channel(channel_id)
+        if not channel:
+            return None
+        webhook = self.bot.config.webhook(server_id) if via_webhook else None
+        if webhook is None:
+            return channel
+        return WebhookTarget(self, server_id, channel, self.webhook_factory(*webhook))
+
+    async def forget_webhook(self, server_id: int):
+        self.bot.config.remove_webhook(server_id)
+        await self.bot.database.remove_webhook(server_id)
+
+    def forget(self, key: Hashable):
+        self.fingerprints.pop(key, None)
+
+    def message_refs(self, messages: Dict[Hashable, Any]) -> Dict[Hashable, Tuple[int, int]]:
+        return {server_id: (message.channel.id, message.id) for server_id, message in messages.items() if message}
+
+    def restore_messages(self, refs: Dict[Hashable, Tuple[int, int]]) -> Dict[Hashable, Any]:
+        # 保存しておいた channel_id/message_id から通信せずに編集用のPartialMessageを作る
+        return {
+            server_id: self.bot.get_partial_messageable(channel_id).get_partial_message(message_id)
+            for server_id, (channel_id, message_id) in refs.items()
+        }
+
+    async def run(
+        self,
+        label: str,
+        targets: Dict[Hashable, Any],
+        send: Callable[[Any], Awaitable[Any]],
+        kind: str = "send",
+        priority: Optional[int] = None,
+        collapse_key: Optional[Callable[[Any], Hashable]] = None,
+        limited: Optional[Callable[[Any], bool]] = None
+    ) -> Dict[Hashable, Any]:
+        # シャードごとに配信レーンを分け、1つのシャードの遅いサーバーが他のシャードを待たせないようにする
+        if priority is None:
+            priority = PRIORITY_ALERT if kind == "send" else PRIORITY_EDIT
+        lanes = {self.shard_of(key) for key in targets}
+        results = {}
+        delivered_at = []
+        started = time.monotonic()
+
+        async def deliver(key, target):
+            try:
+                results[key] = await self.queue.submit(
+                    self.shard_of(key),
+                    priority,
+                    kind,
+                    partial(send, target),
+                    collapse_key(target) if collapse_key else None,
+                    limited(target) if limited else True
+                )
+                delivered_at.append(time.monotonic())
+            except Exception as e:
+                print(f"{label} delivery error ({key}): {str(e)}")
+
+        await asyncio.gather(*(deliver(key, target) for key, target in targets.items()))
+
+        if targets:
+            spread = delivered_at[-1] - delivered_at[0] if delivered_at else 0.0
+            report = FanoutReport(label, len(targets), len(results), time.monotonic() - started, spread, len(lanes))
+            self.reports[label] = report
+            print(
+                f"{label} fan-out: {report.delivered}/{report.targets} delivered "
+                f"in {report.elapsed:.2f}s (first to last {report.spread:.2f}s, {report.shards} shards)"
+            )
+        return results
+
+    async def deliver(
+        self,
+        label: str,
+        messages: Dict[int, Tuple[int, Dict[str, Any]]],
+        via_webhook: bool = False
+    ) -> Dict[Hashable, Any]:
+        # server_id -> (channel_id, 送信内容)。via_webhook=True ならWebhookを設定済みのサーバーにはWebhookで送る
+        targets = {}
+        for server_id, (channel_id, kwargs) in messages.items():
+            destination = self.destination(server_id, channel_id, via_webhook)
+            if destination:
+                targets[server_id] = (destination, kwargs)
+        return await self.run(
+            label,
+            targets,
+            lambda target: target[0].send(**target[1]),
+            limited=lambda target: getattr(target[0], "rate_limited", True)
+        )
+
+    async def broadcast(
+        self,
+        label: str,
+        provider: Optional[str] = None,
+        via_webhook: bool = False,
+        **kwargs
+    ) -> Dict[Hashable, Any]:
+        # 配信中に設定が変わっても影響を受けないよう、その時点のスナップショットに送る。
+        # provider を渡すとそのサービスを購読しているサーバーだけに送る
+        messages = {server_id: (channel_id, kwargs) for server_id, channel_id in self.bot.config.snapshot(provider).items()}
+        return await self.deliver(label, messages, via_webhook)
+
+    async def edit(
+        self,
+        label: str,
+        messages: Dict[Hashable, Any],
+        priority: int = PRIORITY_EDIT,
+        wait: bool = True,
+        **kwargs
+    ) -> Dict[Hashable, Any]:
+        # 同じメッセージへの編集がまだキューに残っていれば、最新の内容だけを送る。
+        # wait=False の場合はキューに入れるだけで戻り、次のポーリングを待たせない
+        targets = {server_id: message for server_id, message in messages.items() if message}
+        delivery = self.run(
+            label,
+            targets,
+            lambda message: message.edit(**kwargs),
+            kind="edit",
+            priority=priority,
+            collapse_key=lambda message: (message.channel.id, message.id)
+        )
+        if wait:
+            return await delivery
+        task = asyncio.create_task(delivery)
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+        return {}
+
+    async def close(self):
+        await self.queue.close()
+        await asyncio.gather(*self._background, return_exceptions=True)
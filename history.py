@@ -0,0 +1,142 @@
+import sqlite3
+import time
+from typing import Dict, Optional, Tuple
+
+DAY = 86400
+WEEK = 7 * DAY
+UP_STATES = ("none", "ok", "up")
+
+def day_start(timestamp: int) -> int:
+    return timestamp - timestamp % DAY
+
+def week_start(timestamp: int) -> int:
+    # 1970-01-01は木曜日なので、3日ずらして月曜始まりの週にする
+    day = day_start(timestamp)
+    return day - ((day // DAY + 3) % 7) * DAY
+
+class StatusHistory:
+    # 状態が変わった時だけ status_runs に1行追加し(ランレングス)、
+    # 稼働時間は日次・週次のロールアップに積み上げていく
+    def __init__(self, conn: sqlite3.Connection, max_gap: int = 900):
+        self.conn = conn
+        self.max_gap = max_gap
+        self._initialize_tables()
+        cursor = self.conn.execute('SELECT provider, state, last_seen FROM status_current')
+        self.current: Dict[str, Tuple[str, int]] = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+
+    def _initialize_tables(self):
+        with self.conn:
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS status_runs (
+                    provider TEXT NOT NULL,
+                    started_at INTEGER NOT NULL,
+                    state TEXT NOT NULL,
+                    PRIMARY KEY (provider, started_at)
+                ) WITHOUT ROWID
+            ''')
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS status_current (
+                    provider TEXT PRIMARY KEY,
+                    state TEXT NOT NULL,
+                    last_seen INTEGER NOT NULL
+                )
+            ''')
+            self.conn.execute('''
+                CREATE TABLE IF NOT EXISTS uptime_rollups (
+                    provider TEXT NOT NULL,
+                    period TEXT NOT NULL,
+                    period_start INTEGER NOT NULL,
+                    up_seconds INTEGER NOT NULL,
+                    total_seconds INTEGER NOT NULL,
+                    PRIMARY KEY (provider, period, period_start)
+                ) WITHOUT ROWID
+            ''')
+
+    def record(self, provider: str, state: Optional[str], at: Optional[int] = None):
+        if state is None:
+            return
+        at = int(time.time()) if at is None else at
+        previous = self.current.get(provider)
+
+        with self.conn:
+            if previous is not None:
+                previous_state, last_seen = previous
+                # 長く停止していた間は状態が分からないので稼働率に含めない
+                if 0 < at - last_seen <= self.max_gap:
+                    self._accumulate(provider, last_seen, at, previous_state in UP_STATES)
+            if previous is None or previous[0] != state:
+                self.conn.execute('''
+                    INSERT OR REPLACE INTO status_runs (provider, started_at, state)
+                    VALUES (?, ?, ?)
+                ''', (provider, at, state))
+            self.conn.execute('''
+                INSERT OR REPLACE INTO status_current (provider, state, last_seen)
+                VALUES (?, ?, ?)
+            ''', (provider, state, at))
+        self.current[provider] = (state, at)
+
+    def _accumulate(self, provider: str, start: int, end: int, up: bool):
+        for period, period_length, align in (("day", DAY, day_start), ("week", WEEK, week_start)):
+            segment_start = start
+            while segment_start < end:
+                period_start = align(segment_start)
+                segment_end = min(end, period_start + period_length)
+                seconds = segment_end - segment_start
+                self.conn.execute('''
+                    INSERT INTO uptime_rollups (provider, period, period_start, up_seconds, total_seconds)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (provider, period, period_start) DO UPDATE SET
+                        up_seconds = up_seconds + excluded.up_seconds,
+                        total_seconds = total_seconds + excluded.total_seconds
+                ''', (provider, period, period_start, seconds if up else 0, seconds))
+                segment_start = segment_end
+
+    def _sum_rollups(self, provider: str, period: str, start: int, end: int) -> Tuple[int, int]:
+        cursor = self.conn.execute('''
+            SELECT COALESCE(SUM(up_seconds), 0), COALESCE(SUM(total_seconds), 0)
+            FROM uptime_rollups
+            WHERE provider = ? AND period = ? AND period_start >= ? AND period_start < ?
+        ''', (provider, period, start, end))
+        return cursor.fetchone()
+
+    def uptime(self, provider: str, days: int, now: Optional[int] = None) -> Tuple[Optional[float], int]:
+        # 今日を含む直近 days 日間。丸ごと含まれる週は週次ロールアップ、端の日は日次ロールアップから読む
+        now = int(time.time()) if now is None else now
+        window_start = day_start(now) - (days - 1) * DAY
+        window_end = day_start(now) + DAY
+
+        first_week = week_start(window_start)
+        if first_week < window_start:
+            first_week += WEEK
+        last_week = week_start(now)
+
+        if last_week > first_week:
+            ranges = [("week", first_week, last_week), ("day", window_start, first_week), ("day", last_week, window_end)]
+        else:
+            ranges = [("day", window_start, window_end)]
+
+        up_seconds = total_seconds = 0
+        for period, start, end in ranges:
+            up, total = self._sum_rollups(provider, period, start, end)
+            up_seconds += up
+            total_seconds += total
+
+        # 障害の発生回数は正常から正常以外に変わった回数。minor→major→minor のような悪化・回復は1回と数える。
+        # 期間の直前の状態も見るため、期間が始まる前の最後のランから読む
+        up_states = ", ".join("?" * len(UP_STATES))
+        cursor = self.conn.execute(f'''
+            SELECT COUNT(*) FROM (
+                SELECT started_at, state, LAG(state) OVER (ORDER BY started_at) AS previous_state
+                FROM status_runs
+                WHERE provider = ? AND started_at >= COALESCE(
+                    (SELECT MAX(started_at) FROM status_runs WHERE provider = ? AND started_at < ?), ?
+                )
+            )
+            WHERE started_at >= ? AND state NOT IN ({up_states})
+                AND (previous_state IS NULL OR previous_state IN ({up_states}))
+        ''', (provider, provider, window_start, window_start, window_start, *UP_STATES, *UP_STATES))
+        incidents = cursor.fetchone()[0]
+
+        if total_seconds == 0:
+            return None, incidents
+        return up_seconds / total_seconds * 100, incidents
@@ -0,0 +1,143 @@
+import asyncio
+import json
+import time
+import aiohttp
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+from breaker import CLOSED, CircuitBreaker, CircuitOpenError
+from metrics import DECODE_FAILURES, HTTP_ERRORS, HTTP_RESPONSES
+
+class StatusClient:
+    def __init__(
+        self,
+        limit: int = 100,
+        limit_per_host: int = 4,
+        ttl_dns_cache: int = 300,
+        keepalive_timeout: float = 30.0,
+        timeout: float = 15.0,
+        failure_threshold: int = 5,
+        backoff: float = 60.0,
+        max_backoff: float = 1800.0,
+        unknown_after: float = 0.0
+    ):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.ttl_dns_cache = ttl_dns_cache
+        self.keepalive_timeout = keepalive_timeout
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.unknown_after = unknown_after
+        # 取得できない状態が unknown_after 秒続いた時と、その後に戻った時に (name, "unknown"/"recovered", 回路が開いていた秒数) で呼ばれる
+        self.on_notice: Optional[Callable[[str, str, float], Awaitable[None]]] = None
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self._session: Optional[aiohttp.ClientSession] = None
+        self.validators: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+        self.not_modified: Dict[str, int] = {}
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        # ClientSessionはイベントループ上で初めて使われる時に作る
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.limit,
+                limit_per_host=self.limit_per_host,
+                ttl_dns_cache=self.ttl_dns_cache,
+                keepalive_timeout=self.keepalive_timeout
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            )
+        return self._session
+
+    def get(self, url: str, **kwargs):
+        return self.session.get(url, **kwargs)
+
+    def breaker(self, name: str) -> CircuitBreaker:
+        breaker = self.breakers.get(name)
+        if breaker is None:
+            breaker = self.breakers[name] = CircuitBreaker(name, self.failure_threshold, self.backoff, self.max_backoff)
+        return breaker
+
+    async def notice(self, name: str, breaker: CircuitBreaker, open_for: Optional[float] = None):
+        if self.on_notice is None or not self.unknown_after:
+            return
+        open_for = breaker.open_for() if open_for is None else open_for
+        if not breaker.unknown_notified and open_for >= self.unknown_after:
+            breaker.unknown_notified = True
+            await self.on_notice(name, "unknown", open_for)
+        elif breaker.unknown_notified and breaker.state == CLOSED:
+            breaker.unknown_notified = False
+            await self.on_notice(name, "recovered", open_for)
+
+    async def fetch_json(self, name: str, url: str) -> Optional[Any]:
+        # 前回のETag/Last-Modifiedで条件付きGETし、304なら None を返す
+        headers = {}
+        etag, last_modified = self.validators.get(name, (None, None))
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+
+        # 回路が開いている間は接続せずにすぐ失敗させる
+        breaker = self.breaker(name)
+        if not breaker.allow():
+            await self.notice(name, breaker)
+            raise CircuitOpenError(name, breaker.retry_at - time.monotonic())
+
+        try:
+            async with self.get(url, headers=headers) as response:
+                HTTP_RESPONSES.inc(name, response.status)
+                # 2xx と 304 以外は本文がJSONでも失敗として回路に数える
+                if response.status != 304 and not 200 <= response.status < 300:
+                    raise aiohttp.ClientResponseError(
+                        response.request_info,
+                        response.history,
+                        status=response.status,
+                        message=response.reason or "",
+                        headers=response.headers
+                    )
+                if response.status == 304:
+                    self.not_modified[name] = self.not_modified.get(name, 0) + 1
+                    data = None
+                else:
+                    try:
+                        data = await response.json()
+                    except (aiohttp.ContentTypeError, json.JSONDecodeError):
+                        DECODE_FAILURES.inc(name)
+                        raise
+                    if response.status == 200:
+                        self.validators[name] = (response.headers.get("ETag"), response.headers.get("Last-Modified"))
+        except Exception as e:
+            if isinstance(e, (aiohttp.ClientError, asyncio.TimeoutError)) and not isinstance(e, aiohttp.ContentTypeError):
+                HTTP_ERRORS.inc(name, type(e).__name__)
+            breaker.record_failure()
+            await self.notice(name, breaker)
+            raise
+        finally:
+            # キャンセルされても半開の試行枠を占有したままにしない
+            breaker.release()
+
+        # 戻った時の通知にも開いていた時間を載せるため、閉じる前に測っておく
+        open_for = breaker.open_for()
+        breaker.record_success()
+        await self.notice(name, breaker, open_for)
+        return data
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+class RemoteStatusClient(StatusClient):
+    # pollerプロセスから受け取った内容を fetch_json の結果として返す。get() はVRChatの指標取得などでそのまま通信する
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.pending: Dict[str, Any] = {}
+
+    async def fetch_json(self, name: str, url: str) -> Optional[Any]:
+        data = self.pending.pop(name, None)
+        if data is None:
+            self.not_modified[name] = self.not_modified.get(name, 0) + 1
+        return data
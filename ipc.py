@@ -0,0 +1,143 @@
+import asyncio
+import json
+import os
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+from metrics import POLLER_CONNECTED
+
+# 1イベント1行のJSON。summary.jsonのような大きい内容も1行で受け取れるよう上限を広げる
+LINE_LIMIT = 16 * 1024 * 1024
+
+def encode_event(provider: str, data: Optional[Any], notice: Optional[str] = None, open_for: float = 0.0) -> bytes:
+    event = {"provider": provider, "data": data}
+    if notice is not None:
+        event["notice"] = notice
+        event["open_for"] = open_for
+    return json.dumps(event, ensure_ascii=False).encode() + b"\n"
+
+class StatusPublisher:
+    # pollerプロセス側。内容が変わったポーリング結果は本文付き、変わらなかったものは data=null で全購読者に流す
+    def __init__(self, path: str):
+        self.path = path
+        self.latest: Dict[str, Any] = {}
+        self._writers: Set[asyncio.StreamWriter] = set()
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self.handle_subscriber, path=self.path)
+
+    async def handle_subscriber(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # 後から接続したBotにも現在の状態が分かるよう、最新の内容を先に送る
+        for provider, data in self.latest.items():
+            writer.write(encode_event(provider, data))
+        self._writers.add(writer)
+        print(f"Poller subscriber connected ({len(self._writers)} total)")
+        try:
+            await writer.drain()
+            await reader.read()
+        except ConnectionError:
+            pass
+        finally:
+            self._writers.discard(writer)
+            writer.close()
+            print(f"Poller subscriber disconnected ({len(self._writers)} total)")
+
+    async def publish(self, provider: str, data: Optional[Any]):
+        if data is not None:
+            self.latest[provider] = data
+        await self.send(encode_event(provider, data))
+
+    async def publish_notice(self, provider: str, notice: str, open_for: float):
+        # 取得できない状態が続いている("unknown")・戻った("recovered")ことと、その時点で回路が開いていた秒数だけを知らせる。状態の記録には使わない
+        await self.send(encode_event(provider, None, notice, open_for))
+
+    async def send(self, line: bytes):
+        writers = list(self._writers)
+        for writer in writers:
+            writer.write(line)
+        results = await asyncio.gather(*(writer.drain() for writer in writers), return_exceptions=True)
+        for writer, result in zip(writers, results):
+            if isinstance(result, Exception):
+                self._writers.discard(writer)
+                writer.close()
+
+    async def close(self):
+        for writer in list(self._writers):
+            writer.close()
+        self._writers.clear()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+class StatusSubscriber:
+    # Bot側。pollerからのイベントをプロバイダーごとに順番どおり handler に渡し、切断されたら再接続する
+    def __init__(
+        self,
+        path: str,
+        handler: Callable[[str, Optional[Any], Optional[str], float], Awaitable[None]],
+        reconnect_delay: float = 5.0
+    ):
+        self.path = path
+        self.handler = handler
+        self.reconnect_delay = reconnect_delay
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: Set[asyncio.Task] = set()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self):
+        if self.running:
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        tasks = list(self._inflight)
+        if self._task is not None:
+            tasks.append(self._task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+
+    def dispatch(self, provider: str, data: Optional[Any], notice: Optional[str] = None, open_for: float = 0.0):
+        task = asyncio.create_task(self._handle(provider, data, notice, open_for))
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+
+    async def _handle(self, provider: str, data: Optional[Any], notice: Optional[str], open_for: float):
+        # 配信に時間がかかっても他のプロバイダーのイベントは止めない
+        async with self._locks.setdefault(provider, asyncio.Lock()):
+            try:
+                await self.handler(provider, data, notice, open_for)
+            except Exception as e:
+                print(f"{provider} poller event error: {str(e)}")
+
+    async def _run(self):
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path, limit=LINE_LIMIT)
+            except OSError as e:
+                print(f"Poller connection error: {str(e)}")
+                await asyncio.sleep(self.reconnect_delay)
+                continue
+
+            POLLER_CONNECTED.set(1)
+            print(f"Connected to poller at {self.path}")
+            try:
+                while line := await reader.readline():
+                    event = json.loads(line)
+                    self.dispatch(event["provider"], event["data"], event.get("notice"), event.get("open_for", 0.0))
+            except (OSError, ValueError) as e:
+                print(f"Poller connection error: {str(e)}")
+            finally:
+                POLLER_CONNECTED.set(0)
+                writer.close()
+            print("Disconnected from poller")
+            await asyncio.sleep(self.reconnect_delay)
@@ -1,74 +1,209 @@
+import time
+STARTED_AT = time.perf_counter()
+
+import argparse
+import asyncio
+import hashlib
+import json
 import discord
+from datetime import datetime, UTC
+from discord import app_commands
 from discord.ext import commands
 import os
 from dotenv import load_dotenv
-from db import Database
+from db import AsyncDatabase, Database
+from scheduler import PollScheduler
+from http_client import RemoteStatusClient, StatusClient
+from ipc import StatusSubscriber
+from fanout import Fanout
+from providers import STATUSPAGE_PROVIDERS
+from digest import NotificationDigest
+from routing import RoutingTable
+from metrics import MetricsServer
 
 #Cog load
 from vrchatCog import VRchat
-from lineCog import LINE
-from openaiCog import OpenAI
-from discordCog import Discord
-from newrelicCog import NewRelic
-from datadogCog import Datadog
 from slackCog import Slack
 from microsoftCog import Microsoft
-from vercelCog import Vercel
-from glitchCog import Glitch
-from epicCog import Epic
-from githubCog import GitHub
-from StripeCog import Stripe
-from akamaiCog  import Akamai
-from onesignalCog import OneSignal
-from rubygemsCog import RubyGems
-from npmCog import npmjs
-from bitbucketCog import Bitbucket
-from circleciCog import CircleCI
-from travisciCog import TravisCI
-from codecovCog import Codecov
-from sentryCog import Sentry
-from cypressCog import Cypress
-from AirbrakeCog import Airbrake
-from zoomCog import Zoom
-from figmaCog import Figma
+from statuspageCog import StatusPage
+
+IMPORT_TIME = time.perf_counter() - STARTED_AT
+
+def command_tree_fingerprint(tree) -> str:
+    # Discordに同期する内容そのもの(権限・コンテキスト・ローカライズも含む)から計算する
+    commands_data = [command.to_dict(tree) for command in sorted(tree.get_commands(), key=lambda command: command.name)]
+    return hashlib.sha256(json.dumps(commands_data, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+class UptimeBot(commands.AutoShardedBot):
+    force_sync = False
+    webhook_delivery = False
+
+    async def sync_commands(self) -> bool:
+        # コマンド定義が前回の同期から変わった時だけグローバル同期する
+        fingerprint = command_tree_fingerprint(self.tree)
+        key = f"command_tree_fingerprint:{self.application_id}"
+        if not self.force_sync and await self.database.get_meta(key) == fingerprint:
+            return False
+        # 同期に失敗しても起動は続け、記録を更新しないことで次の起動時にやり直す
+        try:
+            await self.tree.sync()
+        except discord.HTTPException as e:
+            print(f"Command sync error: {str(e)}")
+            return False
+        await self.database.set_meta(key, fingerprint)
+        return True
+
+    async def setup_hook(self):
+        # setup_hookはプロセスごとに1回だけ呼ばれるので、再接続のたびに初期化が走ることはない
+        timings = {"imports": IMPORT_TIME}
+
+        started = time.perf_counter()
+        self.config.load(
+            await self.database.get_notification_channels(),
+            await self.database.get_subscriptions(),
+            await self.database.get_webhooks() if self.webhook_delivery else None
+        )
+        timings["db load"] = time.perf_counter() - started
+
+        started = time.perf_counter()
+        await asyncio.gather(
+            self.add_cog(VRchat(self, self.status_client)),
+            self.add_cog(Slack(self, self.status_client)),
+            self.add_cog(Microsoft(self, self.status_client)),
+            self.add_cog(StatusPage(self, self.status_client))
+        )
+        timings["cog registration"] = time.perf_counter() - started
+
+        if self.metrics_server is not None:
+            # ポートが使えなくてもBot自体は起動させる
+            try:
+                await self.metrics_server.start()
+            except OSError as e:
+                print(f"Metrics server error: {str(e)}")
+                await self.metrics_server.close()
+                self.metrics_server = None
+
+        started = time.perf_counter()
+        synced = await self.sync_commands()
+        timings["command sync" if synced else "command sync (skipped)"] = time.perf_counter() - started
+
+        print("Startup timing: " + ", ".join(f"{stage} {seconds * 1000:.0f}ms" for stage, seconds in timings.items()))
+
+    async def handle_poller_event(self, provider: str, data, notice=None, open_for: float = 0.0):
+        # pollerプロセスの取得結果で、自前でポーリングした時と同じ check_status を動かす
+        if notice is not None:
+            await self.send_status_notice(provider, notice, open_for)
+            return
+        job = self.scheduler.jobs.get(provider)
+        if job is None:
+            return
+        self.status_client.pending[provider] = data
+        await job.callback()
+
+    async def send_status_notice(self, provider: str, notice: str, open_for: float):
+        # ステータスページ自体に長い間つながらない時は、障害かどうか分からないことをサーバーに知らせる
+        if provider not in self.scheduler.jobs:
+            return
+        display_name = next((row.display_name for row in STATUSPAGE_PROVIDERS if row.name == provider), provider)
+        unknown = notice == "unknown"
+        embed = discord.Embed(
+            title=f"{display_name} サーバー状態更新",
+            description=f"現在のステータス: {'unknown' if unknown else '取得再開'}",
+            color=discord.Color.light_grey() if unknown else discord.Color.green(),
+            timestamp=datetime.now(UTC)
+        )
+        if unknown:
+            # pollerモードでは自分の unknown_after は0なので、イベントに載ってきた秒数を使う
+            minutes = int(open_for // 60)
+            embed.add_field(name="詳細", value=f"{minutes}分以上ステータスページから状態を取得できていません", inline=False)
+        else:
+            minutes = int(open_for // 60)
+            embed.add_field(name="詳細", value=f"{minutes}分ぶりにステータスページから状態を取得できるようになりました", inline=False)
+        embed.set_footer(text=f"{display_name} Status Monitor")
+        await self.notifications.add(provider, display_name, embed)
+
+    async def close(self):
+        if self.poller is not None:
+            await self.poller.close()
+        if self.metrics_server is not None:
+            await self.metrics_server.close()
+        await self.scheduler.close()
+        await self.notifications.close()
+        await self.fanout.close()
+        await self.status_client.close()
+        await self.database.close()
+        await super().close()
 
 load_dotenv()
 intents = discord.Intents.default()
 intents.message_content = True
-client = commands.Bot(command_prefix="/", intents=intents)
-database = Database()
+shard_count = os.getenv("SHARD_COUNT")
+client = UptimeBot(command_prefix="/", intents=intents, shard_count=int(shard_count) if shard_count else None)
+client.scheduler = PollScheduler(
+    interval=float(os.getenv("POLL_INTERVAL", "60")),
+    max_concurrency=int(os.getenv("POLL_MAX_CONCURRENCY", "4")),
+    min_interval=float(os.getenv("POLL_MIN_INTERVAL", "15")),
+    max_interval=float(os.getenv("POLL_MAX_INTERVAL", "300")),
+    backoff_after=float(os.getenv("POLL_BACKOFF_AFTER", "900"))
+)
+poller_socket = os.getenv("POLLER_SOCKET")
+client.status_client = (RemoteStatusClient if poller_socket else StatusClient)(
+    limit_per_host=int(os.getenv("HTTP_LIMIT_PER_HOST", "4")),
+    ttl_dns_cache=int(os.getenv("HTTP_DNS_CACHE_TTL", "300")),
+    keepalive_timeout=float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "30")),
+    failure_threshold=int(os.getenv("BREAKER_FAILURES", "5")),
+    backoff=float(os.getenv("BREAKER_BACKOFF", "60")),
+    max_backoff=float(os.getenv("BREAKER_MAX_BACKOFF", "1800")),
+    unknown_after=float(os.getenv("BREAKER_UNKNOWN_AFTER", "0"))
+)
+client.status_client.on_notice = client.send_status_notice
+client.fanout = Fanout(
+    client,
+    max_concurrency=int(os.getenv("FANOUT_CONCURRENCY", "10")),
+    rate=float(os.getenv("FANOUT_RATE", "45")),
+    refresh_interval=float(os.getenv("EDIT_REFRESH_INTERVAL", "900"))
+)
+client.notifications = NotificationDigest(client.fanout, window=float(os.getenv("NOTIFY_COALESCE_WINDOW", "10")))
+client.poller = StatusSubscriber(poller_socket, client.handle_poller_event) if poller_socket else None
+client.config = RoutingTable()
+client.webhook_delivery = os.getenv("WEBHOOK_DELIVERY", "0") == "1"
+metrics_port = int(os.getenv("METRICS_PORT", "9108"))
+client.metrics_server = MetricsServer(os.getenv("METRICS_HOST", "127.0.0.1"), metrics_port) if metrics_port else None
+# 稼働率は、ポーリング間隔の上限3回分より長く記録が途切れた区間を含めずに計算する
+database = AsyncDatabase(Database(history_max_gap=int(client.scheduler.max_interval * 3)))
+client.database = database
 
 @client.event
 async def on_ready():
     print(f'Logged in as {client.user}')
-    client.config = database.get_notification_channels()
-    await client.add_cog(VRchat(client))
-    await client.add_cog(LINE(client))
-    await client.add_cog(OpenAI(client))
-    await client.add_cog(Discord(client))
-    await client.add_cog(NewRelic(client))
-    await client.add_cog(Datadog(client))
-    await client.add_cog(Slack(client))
-    await client.add_cog(Microsoft(client))
-    await client.add_cog(Vercel(client))
-    await client.add_cog(Glitch(client))
-    await client.add_cog(Epic(client))
-    await client.add_cog(GitHub(client))
-    await client.add_cog(Stripe(client))
-    await client.add_cog(Akamai(client))
-    await client.add_cog(OneSignal(client))
-    await client.add_cog(npmjs(client))
-    await client.add_cog(RubyGems(client))
-    await client.add_cog(Bitbucket(client))
-    await client.add_cog(CircleCI(client))
-    await client.add_cog(TravisCI(client))
-    await client.add_cog(Codecov(client))
-    await client.add_cog(Sentry(client))
-    await client.add_cog(Cypress(client))
-    await client.add_cog(Airbrake(client))
-    await client.add_cog(Zoom(client))
-    await client.add_cog(Figma(client))
-    await client.tree.sync()
+    # 再接続で何度呼ばれてもスケジューラー(またはpollerの購読)は1つだけ動く
+    if client.poller is not None:
+        client.poller.start()
+    else:
+        client.scheduler.start()
+
+async def provision_webhook(server_id: int, channel: discord.TextChannel) -> bool:
+    # 通知は1チャンネルに1つだけ作ったWebhookから送り、Botのグローバルレート制限を使わないようにする
+    await delete_webhook(server_id)
+    try:
+        webhook = await channel.create_webhook(name="Status Monitor", reason="サービス状態の通知用")
+    except discord.HTTPException as e:
+        print(f"Webhook create error ({server_id}): {str(e)}")
+        return False
+    await database.set_webhook(server_id, webhook.id, webhook.token)
+    client.config.set_webhook(server_id, webhook.id, webhook.token)
+    return True
+
+async def delete_webhook(server_id: int):
+    webhook = client.config.webhook(server_id)
+    if webhook is None:
+        return
+    client.config.remove_webhook(server_id)
+    await database.remove_webhook(server_id)
+    try:
+        await discord.Webhook.partial(*webhook, client=client).delete(reason="通知チャンネルの変更")
+    except discord.HTTPException as e:
+        print(f"Webhook delete error ({server_id}): {str(e)}")
 
 @client.tree.command(name="set_channel", description="何かのサービスに問題が発生したときに通知するチャンネルを設定します")
 async def set_channel(interaction: discord.Interaction, channel: discord.TextChannel):
@@ -76,7 +211,7 @@ async def set_channel(interaction: discord.Interaction, channel: discord.TextCha
         await interaction.response.send_message("このコマンドを実行するには管理者権限が必要です", ephemeral=True)
         return
     
-    current_channel = database.get_channel_id(interaction.guild.id)
+    current_channel = client.config.get(interaction.guild.id)
     if current_channel:
         await interaction.response.send_message(
             f"通知チャンネルを {channel.mention} に上書き設定しました\n"
@@ -89,15 +224,25 @@ async def set_channel(interaction: discord.Interaction, channel: discord.TextCha
             ephemeral=True
         )
     
-    database.add_notification_channel(interaction.guild.id, channel.id)
-    client.config = database.get_notification_channels()
+    await database.add_notification_channel(interaction.guild.id, channel.id)
+    client.config.upsert(interaction.guild.id, channel.id)
+
+    # 同じチャンネルを設定し直した時は作成済みのWebhookをそのまま使う
+    webhook_missing = current_channel != channel.id or client.config.webhook(interaction.guild.id) is None
+    if client.webhook_delivery and webhook_missing:
+        if not await provision_webhook(interaction.guild.id, channel):
+            await interaction.followup.send(
+                "Webhookを作成できなかったため、通常のメッセージで通知します(Webhookの管理権限が必要です)",
+                ephemeral=True
+            )
 
 @client.tree.command(name="check", description="現在設定されている通知チャンネルを表示します")
 async def check(interaction: discord.Interaction):
-    channel_id = database.get_channel_id(interaction.guild.id)
+    channel_id = client.config.get(interaction.guild.id)
     if channel_id:
         await interaction.response.send_message(
-            f"現在の通知チャンネル: <#{channel_id}>",
+            f"現在の通知チャンネル: <#{channel_id}>\n"
+            f"通知するサービス: {format_subscriptions(interaction.guild.id)}",
             ephemeral=True
         )
     else:
@@ -112,9 +257,88 @@ async def remove_channel(interaction: discord.Interaction):
         await interaction.response.send_message("このコマンドを実行するには管理者権限が必要です", ephemeral=True)
         return
     
-    database.remove_notification_channel(interaction.guild.id)
-    client.config = database.get_notification_channels()
+    # Webhookの削除はレート制限で待つことがあるので、インタラクションの期限内に先に応答する
     await interaction.response.send_message("通知チャンネルを削除しました", ephemeral=True)
+    await delete_webhook(interaction.guild.id)
+    await database.remove_notification_channel(interaction.guild.id)
+    client.config.remove(interaction.guild.id)
+
+def resolve_provider(provider: str):
+    return next((job for job in client.scheduler.jobs if job.lower() == provider.lower()), None)
+
+def format_subscriptions(server_id: int) -> str:
+    providers = client.config.subscriptions(server_id)
+    return ", ".join(sorted(providers)) if providers else "すべて"
+
+async def provider_autocomplete(interaction: discord.Interaction, current: str):
+    return [
+        app_commands.Choice(name=name, value=name)
+        for name in sorted(client.scheduler.jobs)
+        if current.lower() in name.lower()
+    ][:25]
+
+@client.tree.command(name="uptime", description="サービスの稼働率を表示します")
+@app_commands.autocomplete(provider=provider_autocomplete)
+async def uptime(interaction: discord.Interaction, provider: str, days: app_commands.Range[int, 1, 365] = 30):
+    name = resolve_provider(provider)
+    if name is None:
+        await interaction.response.send_message(f"{provider} は監視していないサービスです", ephemeral=True)
+        return
+
+    percentage, incidents = await database.get_uptime(name, days)
+    if percentage is None:
+        await interaction.response.send_message(f"{name} の過去{days}日間の記録がまだありません", ephemeral=True)
+        return
+
+    await interaction.response.send_message(
+        f"{name} の過去{days}日間の稼働率: {percentage:.3f}%\n"
+        f"障害の発生回数: {incidents}回",
+        ephemeral=True
+    )
+
+@client.tree.command(name="subscribe", description="このサーバーに通知するサービスを追加します(未設定の場合はすべてのサービスを通知します)")
+@app_commands.autocomplete(provider=provider_autocomplete)
+async def subscribe(interaction: discord.Interaction, provider: str):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("このコマンドを実行するには管理者権限が必要です", ephemeral=True)
+        return
+
+    name = resolve_provider(provider)
+    if name is None:
+        await interaction.response.send_message(f"{provider} は監視していないサービスです", ephemeral=True)
+        return
+
+    await database.add_subscription(interaction.guild.id, name)
+    client.config.subscribe(interaction.guild.id, name)
+    await interaction.response.send_message(
+        f"{name} を通知するサービスに追加しました\n"
+        f"通知するサービス: {format_subscriptions(interaction.guild.id)}",
+        ephemeral=True
+    )
+
+@client.tree.command(name="unsubscribe", description="このサーバーに通知するサービスから外します")
+@app_commands.autocomplete(provider=provider_autocomplete)
+async def unsubscribe(interaction: discord.Interaction, provider: str):
+    if not interaction.user.guild_permissions.administrator:
+        await interaction.response.send_message("このコマンドを実行するには管理者権限が必要です", ephemeral=True)
+        return
+
+    name = resolve_provider(provider)
+    if name is None or name not in client.config.subscriptions(interaction.guild.id):
+        await interaction.response.send_message(f"{provider} は通知するサービスに追加されていません", ephemeral=True)
+        return
+
+    await database.remove_subscription(interaction.guild.id, name)
+    client.config.unsubscribe(interaction.guild.id, name)
+    if client.config.subscriptions(interaction.guild.id):
+        message = f"{name} を通知するサービスから外しました\n通知するサービス: {format_subscriptions(interaction.guild.id)}"
+    else:
+        message = f"{name} を通知するサービスから外しました\n追加されているサービスがなくなったため、すべてのサービスを通知します"
+    await interaction.response.send_message(message, ephemeral=True)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--force-sync", action="store_true", help="コマンド定義が変わっていなくてもスラッシュコマンドを同期する")
+    args = parser.parse_args()
+    client.force_sync = args.force_sync
     client.run(os.getenv("DISCORD_BOT_TOKEN"))
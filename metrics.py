@@ -0,0 +1,153 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        REGISTRY.append(self)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self.samples()
+
+    def samples(self) -> List[str]:
+        return []
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels, amount: float = 1.0):
+        key = tuple(str(label) for label in labels)
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, key)} {value}" for key, value in self.values.items()]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, *labels):
+        self.values[tuple(str(label) for label in labels)] = value
+
+    def dec(self, *labels, amount: float = 1.0):
+        self.inc(*labels, amount=-amount)
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        self.values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *labels):
+        key = tuple(str(label) for label in labels)
+        # [各バケットの件数..., +Inf の件数, 合計]
+        counts = self.values.setdefault(key, [0.0] * (len(self.buckets) + 2))
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+        counts[-2] += 1
+        counts[-1] += value
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, counts in self.values.items():
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, ('le', str(bound)))} {count}")
+            lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, ('le', '+Inf'))} {counts[-2]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {counts[-2]}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {counts[-1]}")
+        return lines
+
+REGISTRY: List[Metric] = []
+
+POLL_DURATION = Histogram("status_poll_duration_seconds", "Time spent in one poll of a provider", ["provider"])
+HTTP_RESPONSES = Counter("status_http_responses_total", "HTTP responses from status endpoints", ["provider", "status"])
+HTTP_ERRORS = Counter("status_http_errors_total", "Failed requests to status endpoints", ["provider", "error"])
+DECODE_FAILURES = Counter("status_decode_failures_total", "Status responses that could not be decoded", ["provider"])
+BREAKER_STATE = Gauge("status_circuit_state", "Circuit breaker state per provider (0 closed, 1 half-open, 2 open)", ["provider"])
+BREAKER_OPENS = Counter("status_circuit_opens_total", "Times a provider's circuit breaker opened", ["provider"])
+BREAKER_REJECTED = Counter("status_circuit_rejected_total", "Polls skipped because the provider's circuit was open", ["provider"])
+DISCORD_LATENCY = Histogram("discord_request_duration_seconds", "Latency of Discord sends and edits", ["kind"])
+DISCORD_RATE_LIMITED = Counter("discord_rate_limited_total", "Discord responses with status 429")
+DISCORD_ERRORS = Counter("discord_errors_total", "Failed Discord sends and edits", ["kind"])
+LOOP_LAG = Gauge("event_loop_lag_seconds", "Most recent event loop lag")
+LOOP_LAG_MAX = Gauge("event_loop_lag_max_seconds", "Largest event loop lag since start")
+OUTBOUND_QUEUE_DEPTH = Gauge("outbound_queue_depth", "Discord requests waiting in the outbound queue", ["priority"])
+OUTBOUND_WAIT = Histogram("outbound_queue_wait_seconds", "Time Discord requests waited in the outbound queue", ["priority"])
+OUTBOUND_COLLAPSED = Counter("outbound_collapsed_edits_total", "Queued edits replaced by a newer edit of the same message")
+OUTBOUND_SKIPPED = Counter("outbound_skipped_edits_total", "Status message edits skipped because the embed was unchanged", ["provider"])
+NOTIFICATIONS_MERGED = Counter("notifications_merged_total", "Notifications sent inside another provider's digest message instead of on their own")
+POLLER_CONNECTED = Gauge("poller_connected", "1 while the bot is connected to the poller process")
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+class RateLimitCounter(logging.Handler):
+    # discord.pyは429を自動でリトライしてログに出すだけなので、そのログを数える
+    def emit(self, record: logging.LogRecord):
+        if record.getMessage().startswith("We are being rate limited"):
+            DISCORD_RATE_LIMITED.inc()
+
+class MetricsServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 9108, lag_interval: float = 0.5):
+        self.host = host
+        self.port = port
+        self.lag_interval = lag_interval
+        self._runner: Optional[web.AppRunner] = None
+        self._lag_task: Optional[asyncio.Task] = None
+        self._handler = RateLimitCounter(level=logging.WARNING)
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle_metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self._lag_task = asyncio.create_task(self.measure_loop_lag())
+        logging.getLogger("discord.http").addHandler(self._handler)
+
+    async def handle_metrics(self, request):
+        return web.Response(body=render().encode(), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+    async def measure_loop_lag(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.lag_interval)
+            lag = max(0.0, time.monotonic() - started - self.lag_interval)
+            LOOP_LAG.set(lag)
+            if lag > LOOP_LAG_MAX.values.get((), 0.0):
+                LOOP_LAG_MAX.set(lag)
+
+    async def close(self):
+        logging.getLogger("discord.http").removeHandler(self._handler)
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+        if self._runner is not None:
+            await self._runner.cleanup()
@@ -0,0 +1,116 @@
+import asyncio
+import os
+import signal
+from functools import partial
+from typing import Any, Dict, Optional
+from dotenv import load_dotenv
+from history import UP_STATES
+from breaker import CircuitOpenError
+from http_client import StatusClient
+from ipc import StatusPublisher
+from metrics import MetricsServer
+from providers import STATUSPAGE_PROVIDERS
+from scheduler import PollScheduler
+from microsoftCog import Microsoft
+from slackCog import Slack
+from vrchatCog import VRchat
+
+def provider_sources() -> Dict[str, str]:
+    sources = {
+        "VRchat": VRchat.status_url,
+        "Slack": Slack.status_url,
+        "Microsoft": Microsoft.status_url
+    }
+    sources.update({provider.name: provider.status_url for provider in STATUSPAGE_PROVIDERS})
+    return sources
+
+def payload_status(data: Any) -> Optional[str]:
+    # Statuspage は status.indicator、Slack は status、Microsoft は IsAllUp
+    if not isinstance(data, dict):
+        return None
+    if "IsAllUp" in data:
+        return "up" if data["IsAllUp"] else "down"
+    status = data.get("status")
+    if isinstance(status, dict):
+        return status.get("indicator")
+    return status
+
+class Poller:
+    def __init__(
+        self,
+        scheduler: PollScheduler,
+        http: StatusClient,
+        publisher: StatusPublisher,
+        metrics_server: Optional[MetricsServer] = None
+    ):
+        self.scheduler = scheduler
+        self.http = http
+        self.publisher = publisher
+        self.metrics_server = metrics_server
+        self.statuses: Dict[str, Optional[str]] = {}
+        self.http.on_notice = self.publisher.publish_notice
+        for name, url in provider_sources().items():
+            self.scheduler.add_job(name, partial(self.poll, name, url))
+
+    async def poll(self, name: str, url: str):
+        # 取得は全Botプロセスで1回だけ。変化がなければ data=null を流して、Bot側の稼働記録だけ進める
+        try:
+            data = await self.http.fetch_json(name, url)
+        except CircuitOpenError:
+            return
+        if data is not None:
+            self.statuses[name] = payload_status(data)
+        self.scheduler.report(name, self.statuses.get(name) not in UP_STATES)
+        await self.publisher.publish(name, data)
+
+    async def run(self):
+        # ポーリング・HTTP・回路の指標はこのプロセスにしか無いので、Botとは別のポートで公開する
+        if self.metrics_server is not None:
+            try:
+                await self.metrics_server.start()
+            except OSError as e:
+                print(f"Metrics server error: {str(e)}")
+                await self.metrics_server.close()
+                self.metrics_server = None
+        await self.publisher.start()
+        self.scheduler.start()
+        print(f"Polling {len(self.scheduler.jobs)} providers, publishing on {self.publisher.path}")
+
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop.set)
+        try:
+            await stop.wait()
+        finally:
+            await self.scheduler.close()
+            await self.publisher.close()
+            await self.http.close()
+            if self.metrics_server is not None:
+                await self.metrics_server.close()
+
+def main():
+    load_dotenv()
+    scheduler = PollScheduler(
+        interval=float(os.getenv("POLL_INTERVAL", "60")),
+        max_concurrency=int(os.getenv("POLL_MAX_CONCURRENCY", "4")),
+        min_interval=float(os.getenv("POLL_MIN_INTERVAL", "15")),
+        max_interval=float(os.getenv("POLL_MAX_INTERVAL", "300")),
+        backoff_after=float(os.getenv("POLL_BACKOFF_AFTER", "900"))
+    )
+    http = StatusClient(
+        limit_per_host=int(os.getenv("HTTP_LIMIT_PER_HOST", "4")),
+        ttl_dns_cache=int(os.getenv("HTTP_DNS_CACHE_TTL", "300")),
+        keepalive_timeout=float(os.getenv("HTTP_KEEPALIVE_TIMEOUT", "30")),
+        failure_threshold=int(os.getenv("BREAKER_FAILURES", "5")),
+        backoff=float(os.getenv("BREAKER_BACKOFF", "60")),
+        max_backoff=float(os.getenv("BREAKER_MAX_BACKOFF", "1800")),
+        unknown_after=float(os.getenv("BREAKER_UNKNOWN_AFTER", "0"))
+    )
+    publisher = StatusPublisher(os.getenv("POLLER_SOCKET", "poller.sock"))
+    metrics_port = int(os.getenv("POLLER_METRICS_PORT", "9109"))
+    metrics_server = MetricsServer(os.getenv("METRICS_HOST", "127.0.0.1"), metrics_port) if metrics_port else None
+    asyncio.run(Poller(scheduler, http, publisher, metrics_server).run())
+
+if __name__ == "__main__":
+    main()
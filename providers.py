@@ -0,0 +1,62 @@
+from typing import Dict, NamedTuple, Optional, Tuple
+
+MAJOR_MINOR = ("major", "minor")
+
+class StatuspageProvider(NamedTuple):
+    name: str
+    page_url: str
+    label: Optional[str] = None
+    # None の場合は "none" 以外のすべてのインジケーターで通知する
+    triggers: Optional[Tuple[str, ...]] = None
+    colors: Optional[Dict[str, str]] = None
+    show_updated_at: bool = False
+    # True の場合は summary.json を取得し、コンポーネント・インシデント単位の変化も通知する
+    components: bool = False
+
+    @property
+    def display_name(self) -> str:
+        return self.label or self.name
+
+    @property
+    def status_url(self) -> str:
+        if self.components:
+            return f"{self.page_url}/api/v2/summary.json"
+        return f"{self.page_url}/api/v2/status.json"
+
+    def is_trigger(self, status: str) -> bool:
+        if self.triggers is None:
+            return status != "none"
+        return status in self.triggers
+
+STATUSPAGE_PROVIDERS = [
+    StatuspageProvider("LINE", "https://api.line-status.info", label="LINE API", triggers=MAJOR_MINOR),
+    StatuspageProvider("OpenAI", "https://status.openai.com", label="OpenAI API", triggers=MAJOR_MINOR),
+    StatuspageProvider("Discord", "https://discordstatus.com", triggers=MAJOR_MINOR),
+    StatuspageProvider("NewRelic", "https://status.newrelic.com", triggers=MAJOR_MINOR),
+    StatuspageProvider("Datadog", "https://status.datadoghq.com", triggers=MAJOR_MINOR),
+    StatuspageProvider("Vercel", "https://www.vercel-status.com", triggers=MAJOR_MINOR),
+    StatuspageProvider("Glitch", "https://status.glitch.com"),
+    StatuspageProvider("Epic", "https://status.epicgames.com", label="Epic Games"),
+    StatuspageProvider("GitHub", "https://www.githubstatus.com"),
+    StatuspageProvider("Stripe", "https://www.stripestatus.com"),
+    StatuspageProvider("Akamai", "https://www.akamaistatus.com"),
+    StatuspageProvider("OneSignal", "https://status.onesignal.com"),
+    StatuspageProvider("NPM", "https://status.npmjs.org", label="npmjs"),
+    StatuspageProvider("RubyGems", "https://status.rubygems.org"),
+    StatuspageProvider("Bitbucket", "https://bitbucket.status.atlassian.com"),
+    StatuspageProvider("CircleCI", "https://status.circleci.com"),
+    StatuspageProvider("TravisCI", "https://www.traviscistatus.com"),
+    StatuspageProvider("Codecov", "https://status.codecov.com"),
+    StatuspageProvider("Sentry", "https://status.sentry.io"),
+    StatuspageProvider("Cypress", "https://www.cypressstatus.com"),
+    StatuspageProvider("Airbrake", "https://status.airbrake.io"),
+    StatuspageProvider("Zoom", "https://status.zoom.us"),
+    StatuspageProvider("Figma", "https://status.figma.com"),
+    StatuspageProvider(
+        "Cloudflare",
+        "https://www.cloudflarestatus.com",
+        triggers=("major", "minor", "critical"),
+        colors={"critical": "dark_red"},
+        show_updated_at=True
+    ),
+]
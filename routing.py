@@ -0,0 +1,122 @@
+from types import MappingProxyType
+from typing import Dict, FrozenSet, Iterable, Mapping, Optional, Set, Tuple
+
+class RoutingSnapshot:
+    def __init__(self, version: int, channels: Mapping[int, int]):
+        self.version = version
+        self.channels = channels
+
+    def items(self):
+        return self.channels.items()
+
+    def __len__(self):
+        return len(self.channels)
+
+class RoutingTable:
+    # server_id -> channel_id の対応表。変更は1行ずつ反映し、配信側には版付きのスナップショットを渡す
+    def __init__(self):
+        self._channels: Dict[int, int] = {}
+        self._subscriptions: Dict[int, Set[str]] = {}
+        self._webhooks: Dict[int, Tuple[int, str]] = {}
+        self.version = 0
+        self._snapshot = RoutingSnapshot(0, MappingProxyType({}))
+        self._provider_snapshots: Dict[str, RoutingSnapshot] = {}
+        self._index_version = -1
+        self._everyone: Dict[int, int] = {}
+        self._subscribers: Dict[str, Dict[int, int]] = {}
+
+    def load(
+        self,
+        channels: Dict[int, int],
+        subscriptions: Optional[Dict[int, Iterable[str]]] = None,
+        webhooks: Optional[Dict[int, Tuple[int, str]]] = None
+    ):
+        self._channels = dict(channels)
+        self._webhooks = dict(webhooks or {})
+        self._subscriptions = {
+            server_id: set(providers)
+            for server_id, providers in (subscriptions or {}).items()
+            if providers
+        }
+        self.version += 1
+
+    def upsert(self, server_id: int, channel_id: int):
+        if self._channels.get(server_id) != channel_id:
+            self._channels[server_id] = channel_id
+            self.version += 1
+
+    def remove(self, server_id: int):
+        self._webhooks.pop(server_id, None)
+        if self._channels.pop(server_id, None) is not None:
+            self.version += 1
+
+    def get(self, server_id: int) -> Optional[int]:
+        return self._channels.get(server_id)
+
+    def webhook(self, server_id: int) -> Optional[Tuple[int, str]]:
+        return self._webhooks.get(server_id)
+
+    def set_webhook(self, server_id: int, webhook_id: int, webhook_token: str):
+        self._webhooks[server_id] = (webhook_id, webhook_token)
+
+    def remove_webhook(self, server_id: int):
+        self._webhooks.pop(server_id, None)
+
+    def subscribe(self, server_id: int, provider: str):
+        providers = self._subscriptions.setdefault(server_id, set())
+        if provider not in providers:
+            providers.add(provider)
+            self.version += 1
+
+    def unsubscribe(self, server_id: int, provider: str):
+        providers = self._subscriptions.get(server_id)
+        if providers and provider in providers:
+            providers.discard(provider)
+            if not providers:
+                del self._subscriptions[server_id]
+            self.version += 1
+
+    def subscriptions(self, server_id: int) -> FrozenSet[str]:
+        return frozenset(self._subscriptions.get(server_id, ()))
+
+    def snapshot(self, provider: Optional[str] = None) -> RoutingSnapshot:
+        # 変更があった時だけコピーするので、配信ごとのコストはほぼ0
+        if provider is not None:
+            return self._provider_snapshot(provider)
+        if self._snapshot.version != self.version:
+            self._snapshot = RoutingSnapshot(self.version, MappingProxyType(dict(self._channels)))
+        return self._snapshot
+
+    def _provider_snapshot(self, provider: str) -> RoutingSnapshot:
+        cached = self._provider_snapshots.get(provider)
+        if cached is not None and cached.version == self.version:
+            return cached
+        if self._index_version != self.version:
+            self._compile()
+        channels = dict(self._everyone)
+        channels.update(self._subscribers.get(provider, {}))
+        snapshot = RoutingSnapshot(self.version, MappingProxyType(channels))
+        self._provider_snapshots[provider] = snapshot
+        return snapshot
+
+    def _compile(self):
+        # provider -> 購読しているサーバーの逆引きを作る。購読設定のないサーバーはすべてのサービスを受け取る
+        everyone = {}
+        subscribers: Dict[str, Dict[int, int]] = {}
+        for server_id, channel_id in self._channels.items():
+            providers = self._subscriptions.get(server_id)
+            if not providers:
+                everyone[server_id] = channel_id
+                continue
+            for provider in providers:
+                subscribers.setdefault(provider, {})[server_id] = channel_id
+        self._everyone = everyone
+        self._subscribers = subscribers
+        self._provider_snapshots.clear()
+        self._index_version = self.version
+
+    def items(self):
+        return self.snapshot().items()
+
+    def __len__(self):
+        return len(self._channels)
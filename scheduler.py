@@ -0,0 +1,167 @@
+import asyncio
+import time
+from datetime import datetime, timedelta, UTC
+from typing import Awaitable, Callable, Dict, Optional, Set
+from metrics import POLL_DURATION
+
+class PollJob:
+    def __init__(self, name: str, callback: Callable[[], Awaitable[None]], interval: float):
+        self.name = name
+        self.callback = callback
+        self.interval = interval
+        self.next_run = 0.0
+        self.last_start = 0.0
+        self.running = False
+        self.active = False
+        self.stable_since: Optional[float] = None
+        self.last_duration: Optional[float] = None
+
+class PollScheduler:
+    def __init__(
+        self,
+        interval: float = 60.0,
+        max_concurrency: int = 4,
+        min_interval: float = 15.0,
+        max_interval: float = 300.0,
+        backoff_after: float = 900.0,
+        backoff_factor: float = 1.5
+    ):
+        self.interval = interval
+        self.max_concurrency = max_concurrency
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff_after = backoff_after
+        self.backoff_factor = backoff_factor
+        self.jobs: Dict[str, PollJob] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: Set[asyncio.Task] = set()
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def add_job(self, name: str, callback: Callable[[], Awaitable[None]], interval: Optional[float] = None):
+        if name in self.jobs:
+            raise ValueError(f"Poll job already registered: {name}")
+        job = PollJob(name, callback, interval or self.interval)
+        if self.running:
+            job.next_run = self._free_slot()
+        self.jobs[name] = job
+        self._notify()
+
+    def remove_job(self, name: str):
+        self.jobs.pop(name, None)
+        self._notify()
+
+    def report(self, name: str, active: bool):
+        job = self.jobs.get(name)
+        if job is not None:
+            job.active = active
+
+    def next_run(self, name: str) -> Optional[datetime]:
+        job = self.jobs.get(name)
+        if job is None or not self.running:
+            return None
+        return datetime.now(UTC) + timedelta(seconds=max(0.0, job.next_run - time.monotonic()))
+
+    def schedule(self) -> Dict[str, Optional[datetime]]:
+        return {name: self.next_run(name) for name in self.jobs}
+
+    def start(self):
+        if self.running:
+            return
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._wakeup = asyncio.Event()
+        self._spread()
+        self._task = asyncio.create_task(self._run())
+
+    async def close(self):
+        tasks = list(self._inflight)
+        if self._task is not None:
+            tasks.append(self._task)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+
+    def _spread(self):
+        # 全ジョブを間隔内に均等に配置し、毎分の一斉リクエストを避ける
+        if not self.jobs:
+            return
+        now = time.monotonic()
+        step = self.interval / len(self.jobs)
+        for index, job in enumerate(self.jobs.values()):
+            job.next_run = now + index * step
+
+    def _free_slot(self) -> float:
+        # 稼働中に追加されたジョブは既存ジョブの最も大きい隙間の中央に入れる
+        now = time.monotonic()
+        if not self.jobs:
+            return now
+        runs = sorted(job.next_run for job in self.jobs.values())
+        best_start, best_gap = runs[-1], runs[0] + self.interval - runs[-1]
+        for current, following in zip(runs, runs[1:]):
+            if following - current > best_gap:
+                best_start, best_gap = current, following - current
+        return max(now, best_start + best_gap / 2)
+
+    def _adapt(self, job: PollJob):
+        # 障害中は最短間隔で、安定が続いたら上限まで徐々に間隔を伸ばす
+        now = time.monotonic()
+        if job.active:
+            job.stable_since = None
+            interval = self.min_interval
+        elif job.stable_since is None:
+            job.stable_since = now
+            interval = self.interval
+        elif now - job.stable_since >= self.backoff_after:
+            interval = max(job.interval, self.interval) * self.backoff_factor
+        else:
+            interval = self.interval
+
+        job.interval = max(self.min_interval, min(self.max_interval, interval))
+        job.next_run = job.last_start + job.interval
+
+    def _notify(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = time.monotonic()
+            for job in list(self.jobs.values()):
+                if job.running or job.next_run > now:
+                    continue
+                job.running = True
+                job.last_start = now
+                job.next_run += job.interval
+                if job.next_run <= now:
+                    job.next_run = now + job.interval
+                task = asyncio.create_task(self._execute(job))
+                self._inflight.add(task)
+                task.add_done_callback(self._inflight.discard)
+
+            upcoming = [job.next_run for job in self.jobs.values() if not job.running]
+            timeout = max(0.0, min(upcoming) - time.monotonic()) if upcoming else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _execute(self, job: PollJob):
+        async with self._semaphore:
+            started = time.monotonic()
+            try:
+                await job.callback()
+            except Exception as e:
+                print(f"{job.name} poll job error: {str(e)}")
+            finally:
+                job.last_duration = time.monotonic() - started
+                POLL_DURATION.observe(job.last_duration, job.name)
+                job.running = False
+                if job.name in self.jobs:
+                    self._adapt(job)
+                self._notify()
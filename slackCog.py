@@ -1,63 +1,82 @@
 import discord
-from discord.ext import commands, tasks
-import aiohttp
+from discord.ext import commands
 from datetime import datetime, UTC
+from breaker import CircuitOpenError
+from fanout import PRIORITY_ALERT
 
 class Slack(commands.Cog):
-    def __init__(self, bot):
+    status_url = "https://slack-status.com/api/v2.0.0/current"
+
+    def __init__(self, bot, http):
         self.bot = bot
-        self.session = aiohttp.ClientSession()
-        self.check_status.start()
+        self.http = http
+        self.bot.scheduler.add_job("Slack", self.check_status)
         self.last_status = None
         self.is_api_heavy = False
         self.status_messages = {}
 
+    async def cog_load(self):
+        saved = (await self.bot.database.get_provider_states()).get("Slack")
+        if saved:
+            self.is_api_heavy, self.last_status, refs = saved
+            self.status_messages = self.bot.fanout.restore_messages(refs)
+
     def cog_unload(self):
-        self.check_status.cancel()
-        self.bot.loop.create_task(self.session.close())
+        self.bot.scheduler.remove_job("Slack")
 
-    @tasks.loop(minutes=1.0)
-    async def check_status(self):
-        status_url = "https://slack-status.com/api/v2.0.0/current"
+    async def save_state(self):
+        await self.bot.database.save_provider_state(
+            "Slack",
+            self.is_api_heavy,
+            self.last_status,
+            self.bot.fanout.message_refs(self.status_messages)
+        )
 
+    async def check_status(self):
         try:
-            async with self.session.get(status_url) as response:
-                status_data = await response.json()
-                if not isinstance(status_data, dict):
-                    raise ValueError("Invalid status data format")
-                
-                status = status_data.get('status')
-                if status is None:
-                    raise ValueError("Status not found")
-                
-                if status != "ok" and not self.is_api_heavy:
-                    self.is_api_heavy = True
-                    await self.send_notification(status, status_data)
-                    await self.start_status_updates()
-                
-                elif status == "ok" and self.is_api_heavy:
-                    self.is_api_heavy = False
-                    await self.send_notification(status, status_data)
-                    await self.stop_status_updates()
-
-                if self.is_api_heavy:
-                    await self.update_status_message(status_data)
+            status_data = await self.http.fetch_json("Slack", self.status_url)
+            if status_data is None:
+                await self.bot.database.record_status("Slack", self.last_status)
+                return
 
+            if not isinstance(status_data, dict):
+                raise ValueError("Invalid status data format")
+            
+            status = status_data.get('status')
+            if status is None:
+                raise ValueError("Status not found")
+            self.last_status = status
+            await self.bot.database.record_status("Slack", status)
+            
+            if status != "ok" and not self.is_api_heavy:
+                self.is_api_heavy = True
+                await self.send_notification(status, status_data, then=self.start_status_updates)
+            
+            elif status == "ok" and self.is_api_heavy:
+                self.is_api_heavy = False
+                await self.send_notification(status, status_data, then=self.stop_status_updates)
+
+            self.bot.scheduler.report("Slack", self.is_api_heavy or status != "ok")
+
+            if self.is_api_heavy:
+                await self.update_status_message(status_data)
+
+        except CircuitOpenError:
+            # 回路の開閉は breaker 側でログに出すので、止めている間のポーリングごとには出さない
+            return
         except Exception as e:
             print(f"Slack status check error: {str(e)}")
 
     async def start_status_updates(self):
-        for server_id, channel_id in self.bot.config.items():
-            channel = self.bot.get_channel(channel_id)
-            if channel:
-                message = await channel.send("Slack状態の監視を開始します...")
-                self.status_messages[server_id] = message
+        messages = await self.bot.fanout.broadcast("Slack start", provider="Slack", content="Slack状態の監視を開始します...")
+        self.status_messages.update(messages)
+        await self.save_state()
 
     async def stop_status_updates(self):
-        for server_id, message in self.status_messages.items():
-            if message:
-                await message.edit(content="Slack状態が正常に戻りました。監視を終了します。")
+        await self.bot.fanout.edit("Slack stop", self.status_messages, content="Slack状態が正常に戻りました。監視を終了します。", priority=PRIORITY_ALERT)
         self.status_messages.clear()
+        self.bot.fanout.forget("Slack")
+        await self.save_state()
 
     async def update_status_message(self, status_data):
         embed = discord.Embed(
@@ -67,11 +86,12 @@ class Slack(commands.Cog):
             timestamp=datetime.now(UTC)
         )
         
-        for server_id, message in self.status_messages.items():
-            if message:
-                await message.edit(embed=embed)
+        if self.bot.fanout.is_unchanged("Slack", embed):
+            return
 
-    async def send_notification(self, status, data):
+        await self.bot.fanout.edit("Slack update", self.status_messages, embed=embed, wait=False)
+
+    async def send_notification(self, status, data, then=None):
         color_map = {
             "active": discord.Color.red(),
             "resolved": discord.Color.green(),
@@ -89,10 +109,7 @@ class Slack(commands.Cog):
             embed.add_field(name="詳細", value=self.format_incidents(data), inline=False)
         embed.set_footer(text="Slack Status Monitor")
         
-        for server_id, channel_id in self.bot.config.items():
-            channel = self.bot.get_channel(channel_id)
-            if channel:
-                await channel.send(embed=embed)
+        await self.bot.notifications.add("Slack", "Slack", embed, then=then)
 
     def format_incidents(self, data):
         if not data.get('active_incidents'):
@@ -109,9 +126,5 @@ class Slack(commands.Cog):
         
         return "\n\n".join(incidents)
 
-    @check_status.before_loop
-    async def before_check_status(self):
-        await self.bot.wait_until_ready()
-
 def setup(bot):
-    bot.add_cog(Slack(bot))
+    bot.add_cog(Slack(bot, bot.status_client))
@@ -0,0 +1,174 @@
+import discord
+from discord.ext import commands
+from datetime import datetime, UTC
+from fanout import PRIORITY_ALERT
+from functools import partial
+from breaker import CircuitOpenError
+from components import ComponentTracker
+from providers import STATUSPAGE_PROVIDERS
+
+COLOR_MAP = {
+    "critical": "red",
+    "major": "red",
+    "minor": "gold",
+    "none": "green"
+}
+
+# Embedのフィールドは25個まで
+MAX_CHANGE_FIELDS = 24
+
+class ProviderState:
+    def __init__(self, provider):
+        self.provider = provider
+        self.last_status = None
+        self.is_api_heavy = False
+        self.status_messages = {}
+
+class StatusPage(commands.Cog):
+    def __init__(self, bot, http, providers=STATUSPAGE_PROVIDERS):
+        self.bot = bot
+        self.http = http
+        self.states = {provider.name: ProviderState(provider) for provider in providers}
+        self.components = ComponentTracker()
+        for name, state in self.states.items():
+            self.bot.scheduler.add_job(name, partial(self.check_status, state))
+
+    async def cog_load(self):
+        saved_states = await self.bot.database.get_provider_states()
+        for name, state in self.states.items():
+            if name in saved_states:
+                state.is_api_heavy, state.last_status, refs = saved_states[name]
+                state.status_messages = self.bot.fanout.restore_messages(refs)
+
+    def cog_unload(self):
+        for name in self.states:
+            self.bot.scheduler.remove_job(name)
+
+    async def save_state(self, state):
+        await self.bot.database.save_provider_state(
+            state.provider.name,
+            state.is_api_heavy,
+            state.last_status,
+            self.bot.fanout.message_refs(state.status_messages)
+        )
+
+    async def check_status(self, state):
+        provider = state.provider
+
+        try:
+            status_data = await self.http.fetch_json(provider.name, provider.status_url)
+            if status_data is None:
+                await self.bot.database.record_status(provider.name, state.last_status)
+                return
+
+            if not isinstance(status_data, dict):
+                raise ValueError("Invalid status data format")
+            
+            status = status_data.get('status', {}).get('indicator')
+            if status is None:
+                raise ValueError("Status indicator not found")
+            state.last_status = status
+            await self.bot.database.record_status(provider.name, status)
+            changes = self.components.diff(provider.name, status_data) if provider.components else []
+            
+            if provider.is_trigger(status) and not state.is_api_heavy:
+                state.is_api_heavy = True
+                await self.send_notification(state, status, status_data, changes, then=partial(self.start_status_updates, state))
+            
+            elif status == "none" and state.is_api_heavy:
+                state.is_api_heavy = False
+                await self.send_notification(state, status, status_data, changes, then=partial(self.stop_status_updates, state))
+
+            elif changes and state.is_api_heavy:
+                await self.send_component_changes(state, changes)
+
+            self.bot.scheduler.report(provider.name, state.is_api_heavy or status != "none")
+
+            if state.is_api_heavy:
+                await self.update_status_message(state, status_data)
+
+        except CircuitOpenError:
+            # 回路の開閉は breaker 側でログに出すので、止めている間のポーリングごとには出さない
+            return
+        except Exception as e:
+            print(f"{provider.name} status check error: {str(e)}")
+
+    async def start_status_updates(self, state):
+        messages = await self.bot.fanout.broadcast(f"{state.provider.name} start", provider=state.provider.name, content=f"{state.provider.display_name}状態の監視を開始します...")
+        state.status_messages.update(messages)
+        await self.save_state(state)
+
+    async def stop_status_updates(self, state):
+        await self.bot.fanout.edit(f"{state.provider.name} stop", state.status_messages, content=f"{state.provider.display_name}状態が正常に戻りました。監視を終了します。", priority=PRIORITY_ALERT)
+        state.status_messages.clear()
+        self.bot.fanout.forget(state.provider.name)
+        await self.save_state(state)
+
+    async def update_status_message(self, state, status_data):
+        embed = discord.Embed(
+            title=f"現在の{state.provider.display_name}状態",
+            description=status_data['status']['description'],
+            color=discord.Color.blue(),
+            timestamp=datetime.now(UTC)
+        )
+        
+        if state.provider.show_updated_at:
+            embed.add_field(name="最終更新", value=status_data['page']['updated_at'], inline=False)
+        if state.provider.components:
+            affected = self.components.affected(state.provider.name)
+            if affected:
+                value = "\n".join(f"{name}: {status}" for name, status in affected)
+                embed.add_field(name="影響を受けているコンポーネント", value=value[:1024], inline=False)
+        
+        if self.bot.fanout.is_unchanged(state.provider.name, embed):
+            return
+
+        await self.bot.fanout.edit(f"{state.provider.name} update", state.status_messages, embed=embed, wait=False)
+
+    async def send_notification(self, state, status, data, changes=(), then=None):
+        provider = state.provider
+        
+        embed = discord.Embed(
+            title=f"{provider.display_name} サーバー状態更新",
+            description=f"現在のステータス: {status}",
+            color=self.status_color(provider, status),
+            timestamp=datetime.now(UTC)
+        )
+        
+        embed.add_field(name="詳細", value=data['status']['description'], inline=False)
+        if provider.show_updated_at:
+            embed.add_field(name="最終更新", value=data['page']['updated_at'], inline=False)
+        self.add_change_fields(embed, changes[:MAX_CHANGE_FIELDS - len(embed.fields)])
+        embed.set_footer(text=f"{provider.display_name} Status Monitor")
+        
+        await self.bot.notifications.add(provider.name, provider.display_name, embed, then=then)
+
+    async def send_component_changes(self, state, changes):
+        provider = state.provider
+
+        embed = discord.Embed(
+            title=f"{provider.display_name} コンポーネント状態更新",
+            description=f"{len(changes)}件の変化がありました",
+            color=discord.Color.orange(),
+            timestamp=datetime.now(UTC)
+        )
+        self.add_change_fields(embed, changes[:MAX_CHANGE_FIELDS])
+        if len(changes) > MAX_CHANGE_FIELDS:
+            embed.add_field(name="その他", value=f"ほか{len(changes) - MAX_CHANGE_FIELDS}件", inline=False)
+        embed.set_footer(text=f"{provider.display_name} Status Monitor")
+
+        await self.bot.fanout.broadcast(f"{provider.name} components", provider=provider.name, via_webhook=True, embed=embed)
+
+    def add_change_fields(self, embed, changes):
+        for change in changes:
+            name = f"インシデント: {change.name}" if change.kind == "incident" else change.name
+            embed.add_field(name=name[:256], value=f"{change.previous or '-'} → {change.current or '-'}", inline=False)
+
+    def status_color(self, provider, status):
+        color_name = (provider.colors or {}).get(status, COLOR_MAP.get(status))
+        if color_name is None:
+            return discord.Color.blue()
+        return getattr(discord.Color, color_name)()
+
+def setup(bot):
+    bot.add_cog(StatusPage(bot, bot.status_client))
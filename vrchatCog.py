@@ -1,99 +1,144 @@
 import discord
-from discord.ext import commands, tasks
-import aiohttp
+from discord.ext import commands
 from datetime import datetime, UTC
+from breaker import CircuitOpenError
+from fanout import PRIORITY_ALERT
+import asyncio
+
+METRICS_URLS = {
+    'online_users': "https://d31qqo63tn8lj0.cloudfront.net/visits.json",
+    'api_latency': "https://d31qqo63tn8lj0.cloudfront.net/apilatency.json",
+    'api_requests': "https://d31qqo63tn8lj0.cloudfront.net/apirequests.json",
+    'api_errors': "https://d31qqo63tn8lj0.cloudfront.net/apierrors.json"
+}
+
+METRIC_LABELS = {
+    'online_users': "オンラインユーザー",
+    'api_latency': "APIレイテンシ",
+    'api_requests': "APIリクエスト",
+    'api_errors': "APIエラー率"
+}
 
 class VRchat(commands.Cog):
-    def __init__(self, bot):
+    status_url = "https://status.vrchat.com/api/v2/status.json"
+    metrics_urls = METRICS_URLS
+
+    def __init__(self, bot, http, metric_timeout: float = 10.0):
         self.bot = bot
-        self.session = aiohttp.ClientSession()
-        self.check_status.start()
+        self.http = http
+        self.metric_timeout = metric_timeout
+        self.bot.scheduler.add_job("VRchat", self.check_status)
         self.last_status = None
-        self.last_metrics = {
-            'online_users': None,
-            'api_latency': None,
-            'api_requests': None,
-            'api_errors': None
-        }
+        self.last_status_data = None
         self.is_api_heavy = False
         self.status_messages = {}
 
+    async def cog_load(self):
+        saved = (await self.bot.database.get_provider_states()).get("VRchat")
+        if saved:
+            self.is_api_heavy, self.last_status, refs = saved
+            self.status_messages = self.bot.fanout.restore_messages(refs)
+
     def cog_unload(self):
-        self.check_status.cancel()
-        self.bot.loop.create_task(self.session.close())
+        self.bot.scheduler.remove_job("VRchat")
+
+    async def save_state(self):
+        await self.bot.database.save_provider_state(
+            "VRchat",
+            self.is_api_heavy,
+            self.last_status,
+            self.bot.fanout.message_refs(self.status_messages)
+        )
 
     async def fetch_metric(self, url):
-        async with self.session.get(url) as response:
+        async with self.http.get(url) as response:
             data = await response.json()
             if isinstance(data, list) and len(data) > 0:
                 return data[-1]
             return None
 
-    @tasks.loop(minutes=1.0)
-    async def check_status(self):
-        status_url = "https://status.vrchat.com/api/v2/status.json"
-        metrics_urls = {
-            'online_users': "https://d31qqo63tn8lj0.cloudfront.net/visits.json",
-            'api_latency': "https://d31qqo63tn8lj0.cloudfront.net/apilatency.json",
-            'api_requests': "https://d31qqo63tn8lj0.cloudfront.net/apirequests.json",
-            'api_errors': "https://d31qqo63tn8lj0.cloudfront.net/apierrors.json"
-        }
+    async def fetch_metrics(self):
+        # 各系列を並行に取得し、失敗・タイムアウトした系列だけを欠損扱いにする
+        results = await asyncio.gather(
+            *(asyncio.wait_for(self.fetch_metric(url), timeout=self.metric_timeout)
+              for url in self.metrics_urls.values()),
+            return_exceptions=True
+        )
+
+        metrics = {}
+        for metric_name, metric_data in zip(self.metrics_urls, results):
+            if isinstance(metric_data, Exception):
+                print(f"VRchat metric {metric_name} fetch error: {type(metric_data).__name__} {str(metric_data)}")
+                continue
+            if metric_data and isinstance(metric_data, dict):
+                value = metric_data.get('value')
+                if value is None:
+                    continue
+                    
+                if metric_name == 'api_latency':
+                    metrics[metric_name] = f"{round(value * 1000, 2)}ms"
+                elif metric_name == 'api_errors':
+                    metrics[metric_name] = round(value, 6)
+                elif metric_name == 'api_requests':
+                    metrics[metric_name] = f"{round(value):,}"
+                else:
+                    metrics[metric_name] = value
+        
+        return metrics
 
+    async def check_status(self):
         try:
-            async with self.session.get(status_url) as response:
-                status_data = await response.json()
-                if not isinstance(status_data, dict):
-                    raise ValueError("Invalid status data format")
-                
-                status = status_data.get('status', {}).get('indicator')
-                if status is None:
-                    raise ValueError("Status indicator not found")
-                
-                metrics = {}
-                for metric_name, url in metrics_urls.items():
-                    metric_data = await self.fetch_metric(url)
-                    if metric_data and isinstance(metric_data, dict):
-                        value = metric_data.get('value')
-                        if value is None:
-                            continue
-                            
-                        if metric_name == 'api_latency':
-                            metrics[metric_name] = f"{round(value * 1000, 2)}ms"
-                        elif metric_name == 'api_errors':
-                            metrics[metric_name] = round(value, 6)
-                        elif metric_name == 'api_requests':
-                            metrics[metric_name] = f"{round(value):,}"
-                        else:
-                            metrics[metric_name] = value
-                
-                if status in ["major", "minor"] and not self.is_api_heavy:
-                    self.is_api_heavy = True
-                    await self.send_notification(status, status_data, metrics)
-                    await self.start_status_updates()
-                
-                elif status == "none" and self.is_api_heavy:
-                    self.is_api_heavy = False
-                    await self.send_notification(status, status_data, metrics)
-                    await self.stop_status_updates()
-
-                if self.is_api_heavy:
-                    await self.update_status_message(status_data, metrics)
+            status_data = await self.http.fetch_json("VRchat", self.status_url)
+            if status_data is None:
+                if not self.is_api_heavy or self.last_status_data is None:
+                    await self.bot.database.record_status("VRchat", self.last_status)
+                    return
+                status_data = self.last_status_data
+            self.last_status_data = status_data
 
+            if not isinstance(status_data, dict):
+                raise ValueError("Invalid status data format")
+            
+            status = status_data.get('status', {}).get('indicator')
+            if status is None:
+                raise ValueError("Status indicator not found")
+            self.last_status = status
+            await self.bot.database.record_status("VRchat", status)
+            
+            # メトリクスは通知か監視メッセージ更新に使う時だけ取得する
+            metrics = {}
+            if self.is_api_heavy or status in ["major", "minor"]:
+                metrics = await self.fetch_metrics()
+            
+            if status in ["major", "minor"] and not self.is_api_heavy:
+                self.is_api_heavy = True
+                await self.send_notification(status, status_data, metrics, then=self.start_status_updates)
+            
+            elif status == "none" and self.is_api_heavy:
+                self.is_api_heavy = False
+                await self.send_notification(status, status_data, metrics, then=self.stop_status_updates)
+
+            self.bot.scheduler.report("VRchat", self.is_api_heavy or status != "none")
+
+            if self.is_api_heavy:
+                await self.update_status_message(status_data, metrics)
+
+        except CircuitOpenError:
+            # 回路の開閉は breaker 側でログに出すので、止めている間のポーリングごとには出さない
+            return
         except Exception as e:
             print(f"VRchat status check error: {str(e)}")
 
     async def start_status_updates(self):
-        for server_id, channel_id in self.bot.config.items():
-            channel = self.bot.get_channel(channel_id)
-            if channel:
-                message = await channel.send("API状態の監視を開始します...")
-                self.status_messages[server_id] = message
+        messages = await self.bot.fanout.broadcast("VRchat start", provider="VRchat", content="API状態の監視を開始します...")
+        self.status_messages.update(messages)
+        await self.save_state()
 
     async def stop_status_updates(self):
-        for server_id, message in self.status_messages.items():
-            if message:
-                await message.edit(content="API状態が正常に戻りました。監視を終了します。")
+        await self.bot.fanout.edit("VRchat stop", self.status_messages, content="API状態が正常に戻りました。監視を終了します。", priority=PRIORITY_ALERT)
         self.status_messages.clear()
+        self.bot.fanout.forget("VRchat")
+        await self.save_state()
 
     async def update_status_message(self, status_data, metrics):
         embed = discord.Embed(
@@ -103,16 +148,14 @@ class VRchat(commands.Cog):
             timestamp=datetime.now(UTC)
         )
         
-        embed.add_field(name="オンラインユーザー", value=metrics['online_users'], inline=True)
-        embed.add_field(name="APIレイテンシ", value=metrics['api_latency'], inline=True)
-        embed.add_field(name="APIリクエスト", value=metrics['api_requests'], inline=True)
-        embed.add_field(name="APIエラー率", value=metrics['api_errors'], inline=True)
+        self.add_metric_fields(embed, metrics)
         
-        for server_id, message in self.status_messages.items():
-            if message:
-                await message.edit(embed=embed)
+        if self.bot.fanout.is_unchanged("VRchat", embed):
+            return
+
+        await self.bot.fanout.edit("VRchat update", self.status_messages, embed=embed, wait=False)
 
-    async def send_notification(self, status, data, metrics):
+    async def send_notification(self, status, data, metrics, then=None):
         color_map = {
             "major": discord.Color.red(),
             "minor": discord.Color.gold(),
@@ -127,20 +170,14 @@ class VRchat(commands.Cog):
         )
         
         embed.add_field(name="詳細", value=data['status']['description'], inline=False)
-        embed.add_field(name="オンラインユーザー", value=metrics['online_users'], inline=True)
-        embed.add_field(name="APIレイテンシ", value=metrics['api_latency'], inline=True)
-        embed.add_field(name="APIリクエスト", value=metrics['api_requests'], inline=True)
-        embed.add_field(name="APIエラー率", value=metrics['api_errors'], inline=True)
+        self.add_metric_fields(embed, metrics)
         embed.set_footer(text="VRchat Status Monitor")
         
-        for server_id, channel_id in self.bot.config.items():
-            channel = self.bot.get_channel(channel_id)
-            if channel:
-                await channel.send(embed=embed)
+        await self.bot.notifications.add("VRchat", "VRchat", embed, then=then)
 
-    @check_status.before_loop
-    async def before_check_status(self):
-        await self.bot.wait_until_ready()
+    def add_metric_fields(self, embed, metrics):
+        for metric_name, label in METRIC_LABELS.items():
+            embed.add_field(name=label, value=metrics.get(metric_name, "取得できませんでした"), inline=True)
 
 def setup(bot):
-    bot.add_cog(VRchat(bot))
+    bot.add_cog(VRchat(bot, bot.status_client))